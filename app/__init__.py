@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, jsonify, g, make_response, request, Response, \
-    render_template as render, session as login_session
+    render_template as render, session as login_session, \
+    stream_with_context, send_file, safe_join
+from flask.json import dumps as json_dumps
 from httplib2 import Http
 from flask_httpauth import HTTPBasicAuth
 from oauth2client.client import flow_from_clientsecrets, FlowExchangeError
@@ -10,16 +12,36 @@ from json import dumps, loads
 from requests import get as r_get
 from functools import wraps
 from bleach import clean
+from Queue import Empty
+from os import path
 
 from data_provider import *
-from settings import SECRETS_DIR, app_host, app_port, app_debug
-from resource import get_unique_str, is_index, convert_date, validator
+from models import session as db_session, engine, replicas
+from configure import get_pool_status
+from settings import SECRETS_DIR, app_host, app_port, app_debug, \
+    PAGE_SIZE, MAX_PAGE_SIZE, IMPORT_MAX_ERRORS, STREAM_KEEP_ALIVE, \
+    STREAM_RETRY, COMPRESS_MIN_SIZE, COMPRESS_LEVEL, BROTLI_QUALITY, \
+    COMPRESS_MIMETYPES, JSON_ENCODERS, JSON_SORT_KEYS
+from resource import get_unique_str, is_index, convert_date, validator, \
+    parse_cursor, read_csv, read_ndjson, to_csv_line, PoolBusy, \
+    get_encodings, choose_encoding, compress, load_json_module, JSONEncoder
 from secrets import keys
 
 # define global variables
 app = Flask(__name__)
 app.secret_key = keys.secret_key
+JSONEncoder.module = load_json_module(JSON_ENCODERS)
+app.json_encoder = JSONEncoder
+app.config['JSON_SORT_KEYS'] = JSON_SORT_KEYS
+# Flask indents JSON in debug mode only
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
 auth = HTTPBasicAuth()
+# CSV export columns, readable by the CSV import
+EXPORT_COLUMNS = ['id', 'title', 'description', 'client', 'client_name',
+                  'client_priority', 'target_date', 'product_area',
+                  'product_area_name', 'is_active']
+COMPRESS_LEVELS = {'gzip': COMPRESS_LEVEL, 'br': BROTLI_QUALITY}
+STATIC_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
 
 
 @app.before_request
@@ -29,12 +51,123 @@ def before_request():
 
     :return void:
     """
+    # read your writes: the last write of this user is sticky
+    if replicas:
+        db_session().written_at = login_session.get('written_at', 0)
+
     if 'uid' in login_session:
         g.user = get_user_by_id(login_session['uid'])
     else:
         g.user = None
 
 
+@app.after_request
+def after_request(response):
+    """
+    Save time of the last write to the user session, so the next
+    requests of the user read from the primary database
+
+    :param response: Response object
+    :return object:
+    """
+    if not replicas:
+        return response
+
+    written_at = db_session().written_at
+    if written_at and written_at != login_session.get('written_at'):
+        login_session['written_at'] = written_at
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress the response if the client accepts gzip or brotli,
+    responses smaller than COMPRESS_MIN_SIZE and streams are
+    sent as is. Static files are replaced by their compressed
+    variants if the variants exist.
+
+    :param response: Response object
+    :return object:
+    """
+    if request.endpoint == 'static':
+        return compress_static(response)
+
+    if response.status_code != 200 or response.is_streamed or \
+            response.direct_passthrough or \
+            response.mimetype not in COMPRESS_MIMETYPES or \
+            'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings, get_encodings())
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding, COMPRESS_LEVELS[encoding]))
+    response.headers['Content-Encoding'] = encoding
+
+    # the compressed body is not the same bytes, but the same content
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_static(response):
+    """
+    Replace a static file by its variant compressed by
+    compress_static.py, if the client accepts it
+
+    :param response: Response object
+    :return object:
+    """
+    if response.status_code != 200:
+        return response
+
+    file_path = safe_join(app.static_folder, request.view_args['filename'])
+    variants = [encoding for encoding in ('br', 'gzip')
+                if path.isfile(file_path + STATIC_SUFFIXES[encoding])]
+    if not variants:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings, variants)
+    if encoding is None:
+        return response
+
+    response.close()
+    compressed = send_file(
+        file_path + STATIC_SUFFIXES[encoding], mimetype=response.mimetype,
+        conditional=True, cache_timeout=app.get_send_file_max_age(file_path))
+    compressed.headers['Content-Encoding'] = encoding
+    compressed.vary.add('Accept-Encoding')
+    return compressed
+
+
+@app.errorhandler(PoolBusy)
+def pool_busy(error):
+    """
+    Too many passwords are hashed at the moment
+
+    :param error: PoolBusy object
+    :return string: (JSON)
+    """
+    return jsonify({'error': "The server is busy, try again later"}), 503
+
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """
+    Remove database session of the current thread
+
+    :param exception: exception object or None
+    :return void:
+    """
+    db_session.remove()
+
+
 def login_required(f):
     """
     Checking to see if the user is logged in
@@ -51,7 +184,7 @@ def login_required(f):
             return f(*args, **kwargs)
         else:
             message = 'You are not allowed to access there'
-            return jsonify({'error', message}), 200
+            return jsonify({'error': message}), 200
 
     return decorated_function
 
@@ -76,6 +209,38 @@ def csrf_protection(f):
     return decorated_function
 
 
+def conditional_get(*names):
+    """
+    Set ETag of the response from version numbers of the given
+    tables. If the ETag matches If-None-Match header of the
+    request, return 304 without calling the view function.
+
+    :param names: strings, table names
+    :return function:
+    """
+
+    def decorator(f):
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = get_versions(*names)
+            etag = '-'.join('%s.%s' % (name, versions[name])
+                            for name in names)
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
 # TODO: Verification of password
 @auth.verify_password
 def verify_password(_login, password):
@@ -87,22 +252,161 @@ def verify_password(_login, password):
     :return bool:
     """
 
-    # Try to see if it's a token first
-    user_id = User.verify_auth_token(_login)
-    if user_id:
-        user = get_user_by_id(user_id)
+    # Try to see if it's a token first, the claims of the token
+    # are enough to authorize, the user is loaded only if needed
+    claims = User.load_auth_token(_login)
+    if claims:
+        if claims.get('ver') != get_token_version(claims['uid']):
+            # the token was revoked or the user was removed
+            return False
+        if g.user is not None and g.user.id != claims['uid']:
+            g.user = None
+        g.claims = claims
+        return True
+
+    # if not try to find a user by email
+    user = get_user_by_email(_login.lower())
+    if not user:
+        return False
     else:
-        # if not try to find a user by email
-        user = get_user_by_email(_login.lower())
-        if not user:
+        if not user.verify_password(password):
             return False
-        else:
-            if not user.verify_password(password):
-                return False
+        rehash_password(user, password)
     g.user = user
     return True
 
 
+def load_user():
+    """
+    Returns the current user. If the user was authorized by
+    claims of the token, the user is loaded now
+
+    :return object or None:
+    """
+    if g.get('user') is None and g.get('claims'):
+        g.user = get_user_by_id(g.claims['uid'])
+    return g.get('user')
+
+
+def get_page(is_active):
+    """
+    Read limit and after parameters of keyset pagination from the
+    query string. If limit is not given return the full list of
+    requests, else return a page of requests
+
+    :param is_active: boolean
+    :return string: (JSON)
+    """
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+
+    if limit is None:
+        if is_active:
+            return jsonify(get_requests()), 200
+        return jsonify(get_completed_requests()), 200
+
+    if not is_index(limit):
+        return jsonify({'error': "Limit has to be an integer"}), 200
+
+    limit = min(int(limit), MAX_PAGE_SIZE)
+
+    if after:
+        after = parse_cursor(after)
+        if after is None:
+            return jsonify({'error': "Invalid cursor"}), 200
+
+    return jsonify(get_requests_page(is_active, limit, after)), 200
+
+
+def is_delta():
+    """
+    Check that front-end asked only for changed rows
+    instead of the full list
+
+    :return bool:
+    """
+    return request.args.get('delta') == '1'
+
+
+def is_count():
+    """
+    Check that front-end asked for amount of requests which
+    block removal of a client or a product area
+
+    :return bool:
+    """
+    return request.args.get('count') == '1'
+
+
+def validate_request(data):
+    """
+    Check validity of fields of a request and clean data. Returns
+    tuple (cleaned request, None), if data is not valid returns
+    tuple (None, error message)
+
+    :param data: dict
+    :return tuple:
+    """
+    user_request = dict()
+
+    def field_validation(field):
+        """
+        Checks the field on existing, not too short and is a string.
+
+        :param field: string
+        :return object:
+        """
+        if not data.get(field):
+            return False
+
+        if len(data.get(field)) < 3:
+            return False
+
+        if not isinstance(data.get(field), basestring):
+            return False
+
+        return True
+
+    # validate fields
+    if not field_validation("title"):
+        return None, "Invalid title"
+    if not field_validation("description"):
+        return None, "Invalid description"
+    if not field_validation("target_date"):
+        return None, "Invalid target date"
+
+    # define fields
+    user_request["title"] = clean(data.get("title"))
+    user_request["description"] = clean(data.get("description"))
+    user_request["client"] = None
+    user_request["product_area"] = None
+    user_request["client_priority"] = None
+    user_request["target_date"] = convert_date(data.get("target_date"))
+
+    if user_request["target_date"] is None:
+        return None, "The date has the wrong format"
+
+    client = data.get("client")
+    if isinstance(client, dict) and is_index(client.get("client_priority")):
+        user_request['client_priority'] = int(client.get("client_priority"))
+    else:
+        return None, "Client priority has to be an integer"
+
+    if is_index(client.get("id")):
+        user_request["client"] = int(client.get("id"))
+    else:
+        return None, "Client id has to be an integer"
+
+    product_area = data.get("product_area")
+
+    if isinstance(product_area, dict) and is_index(product_area.get('id')):
+        user_request["product_area"] = int(product_area.get('id'))
+    else:
+        return None, "Product area id has to be an integer"
+
+    return user_request, None
+
+
 def check_request(f):
     """
     Check validity of fields and clean data from the front-end
@@ -123,70 +427,20 @@ def check_request(f):
         if not bool(data):
             return jsonify({'error': "Server does not get any data"}), 200
 
-        user_request = dict()
-
-        def field_validation(field):
-            """
-            Checks the field on existing, not too short and is a string.
-
-            :param field: string
-            :return object:
-            """
-            if not data.get(field):
-                return False
-
-            if len(data.get(field)) < 3:
-                return False
-
-            if not isinstance(data.get(field), basestring):
-                return False
-
-            return True
-
-        # validate fields
-        if not field_validation("title"):
-            return jsonify({'error': "Invalid title"}), 200
-        if not field_validation("description"):
-            return jsonify({'error': "Invalid description"}), 200
-        if not field_validation("target_date"):
-            return jsonify({'error': "Invalid target date"}), 200
-
-        # define fields
-        user_request["title"] = clean(data.get("title"))
-        user_request["description"] = clean(data.get("description"))
-        user_request["client"] = None
-        user_request["product_area"] = None
-        user_request["client_priority"] = None
-        user_request["target_date"] = convert_date(data.get("target_date"))
-
-        if user_request["target_date"] is None:
-            return jsonify({'error': "The date has the wrong format"}), 200
-
-        client = data.get("client")
-        if client and is_index(client.get("client_priority")):
-            user_request['client_priority'] = int(
-                client.get("client_priority"))
-        else:
-            return jsonify(
-                {'error': "Client priority has to be an integer"}), 200
-
-        if client and is_index(client.get("id")):
-            user_request["client"] = int(client.get("id"))
-        else:
-            return jsonify({'error': "Client id has to be an integer"})
+        user_request, error = validate_request(data)
+        if error:
+            return jsonify({'error': error}), 200
 
-        product_area = data.get("product_area")
+        # check the client, the product area, the edited request
+        # and the client priority with one query
+        request_id = data.get('id')
+        g.checks = check_request_data(
+            user_request, int(request_id) if is_index(request_id) else None)
 
-        if product_area and is_index(product_area.get('id')):
-            user_request["product_area"] = int(product_area.get('id'))
-        else:
-            return jsonify(
-                {'error': "Product area id has to be an integer"}), 200
-
-        if not client_exist(user_request["client"]):
+        if not g.checks['client']:
             return jsonify({'error': "The client is not found"}), 200
 
-        if not product_area_exist(user_request["product_area"]):
+        if not g.checks['product_area']:
             return jsonify({'error': "The product area is not found"}), 200
 
         g.user_request = user_request
@@ -205,7 +459,7 @@ def front_end():
     """
     csrf_token = get_unique_str(36)
     login_session['csrf_token'] = csrf_token
-    return render("index.html", csrf=csrf_token)
+    return render("index.html", csrf=csrf_token, page_size=PAGE_SIZE)
 
 
 # TODO: User registration
@@ -273,6 +527,9 @@ def get_auth_token():
 
     :return string: JSON
     """
+    if not load_user():
+        return jsonify({'error': "The user does not exist"}), 200
+
     token = g.user.generate_auth_token().decode('ascii')
     login_session['uid'] = int(g.user.id)
     return jsonify({'token': token, 'user': g.user.serialize}), 200
@@ -360,8 +617,8 @@ def login(provider):
 @auth.login_required
 def user_logout():
     """
-    Logged out user, remove session, and send logout message
-    back to front-end
+    Logged out user, remove session, revoke auth tokens of the
+    user, and send logout message back to front-end
 
     :return:
     """
@@ -372,9 +629,12 @@ def user_logout():
     if 'provider' in login_session:
         del login_session['provider']
 
-    if not g.user:
+    user = load_user()
+    if not user:
         return jsonify({'error': "You are already logged out"}), 200
 
+    # tokens of the user are not valid after logout
+    revoke_tokens(user.id)
     g.user = None
     return jsonify({'info': "You are now logged out"}), 200
 
@@ -391,6 +651,7 @@ def update_user_profile():
 
     # get JSON data
     data = request.get_json()
+    load_user()
 
     user = get_user_by_email(data.get('email'))
     if user and data.get('email') != g.user.email:
@@ -415,7 +676,12 @@ def update_user_profile():
 
     # add user to global
     g.user = user
-    return jsonify(user.serialize), 200
+    if not usr['password']:
+        return jsonify(user.serialize), 200
+
+    # old tokens are revoked with the password, send a new one
+    token = user.generate_auth_token().decode('ascii')
+    return jsonify(dict(user.serialize, token=token)), 200
 
 
 @app.route('/profile/remove', methods=['POST'])
@@ -427,7 +693,7 @@ def remove_user_profile():
 
     :return String: (JSON)
     """
-    user = dict(g.user.serialize)
+    user = dict(load_user().serialize)
     g.user = None
     remove_user(user['uid'])
 
@@ -463,8 +729,10 @@ def new_client():
     if len(data.get("name")) < 3:
         return jsonify({'error': 'Client name is too short'})
 
-    create_client(name=clean(data.get("name")))
+    client = create_client(name=clean(data.get("name")))
 
+    if is_delta():
+        return jsonify(get_clients_delta([client.id])), 200
     return jsonify(get_clients()), 200
 
 
@@ -497,7 +765,7 @@ def update_client_info():
     # check client exist
     if client_exist(data['id']):
         # return list of clients
-        return jsonify(update_client(data)), 200
+        return jsonify(update_client(data, is_delta())), 200
     else:
         return jsonify({'error': "Can't find this client"}), 200
 
@@ -527,14 +795,18 @@ def delete_client():
     # check that every request does not use current client
     if check_client_relation(data['id']):
         msg = "This client is currently being used in this requests"
+        if is_count():
+            return jsonify({'error': msg, 'blocking':
+                            count_client_relation(data['id'])}), 200
         return jsonify({'error': msg}), 200
 
-    return jsonify(remove_client(data['id'])), 200
+    return jsonify(remove_client(data['id'], is_delta())), 200
 
 
 @app.route('/clients')
 @csrf_protection
 @auth.login_required
+@conditional_get('client')
 def get_all_clients():
     """
     Return all request in JSON
@@ -570,9 +842,11 @@ def new_product_area():
         return jsonify({'error': 'Product area can not be an integer'})
 
     # create product area
-    create_product_area(name=clean(data.get("name")))
+    product_area = create_product_area(name=clean(data.get("name")))
 
     # return list of areas
+    if is_delta():
+        return jsonify(get_product_areas_delta([product_area.id])), 200
     return jsonify(get_product_areas()), 200
 
 
@@ -605,7 +879,7 @@ def update_product_area_info():
         return jsonify({'error': "Can't find this product area"}), 200
 
     # return list of clients
-    return jsonify(update_product_area(data)), 200
+    return jsonify(update_product_area(data, is_delta())), 200
 
 
 @app.route('/areas/delete', methods=['POST'])
@@ -634,14 +908,18 @@ def delete_product_area():
     # check that current product area id isn't being used already in request
     if check_product_area_relation(data['id']):
         msg = "This product area is currently being used in a request(s)"
+        if is_count():
+            return jsonify({'error': msg, 'blocking':
+                            count_product_area_relation(data['id'])}), 200
         return jsonify({'error': msg}), 200
 
-    return jsonify(remove_product_area(data['id'])), 200
+    return jsonify(remove_product_area(data['id'], is_delta())), 200
 
 
 @app.route('/areas')
 @csrf_protection
 @auth.login_required
+@conditional_get('product_area')
 def get_all_product_areas():
     """
     Return all requests in JSON format
@@ -671,17 +949,121 @@ def new_request():
     """
     # get user request
     user_request = g.user_request
+    shifted = list()
 
     # check that client priority is not taken
-    if client_priority_is_taken(user_request):
+    if g.checks['taken']:
         # else shift all requests where client priority >= current priority
-        update_client_priorities(user_request)
+        shifted = update_client_priorities(user_request)
 
     # clean RAM
     del g.user_request
 
     # send list of requests to front-end
-    return jsonify(create_request(user_request)), 200
+    result = create_request(user_request, is_delta(), shifted)
+    return jsonify(result), 200
+
+
+@app.route('/requests/import', methods=['POST'])
+@csrf_protection
+@auth.login_required
+def import_request_list():
+    """
+    Import requests from CSV (text/csv) or newline delimited JSON.
+    Every row is validated the same way as a new request, invalid
+    rows are skipped and reported in the summary.
+
+    :return String: (JSON)
+    """
+    if request.mimetype == 'text/csv':
+        rows = read_csv(request.stream)
+    else:
+        rows = read_ndjson(request.stream)
+
+    clients = get_client_ids()
+    areas = get_product_area_ids()
+    requests = list()
+    errors = list()
+
+    for number, data in enumerate(rows, 1):
+        if data is None:
+            user_request, error = None, "The row can not be read"
+        else:
+            user_request, error = validate_request(data)
+
+        if not error and user_request["client"] not in clients:
+            error = "The client is not found"
+        if not error and user_request["product_area"] not in areas:
+            error = "The product area is not found"
+
+        if error:
+            errors.append({'row': number, 'error': error})
+        else:
+            requests.append(user_request)
+
+    summary = import_requests(requests)
+    summary['skipped'] = len(errors)
+    summary['errors'] = errors[:IMPORT_MAX_ERRORS]
+    return jsonify(summary), 200
+
+
+@app.route('/requests/export')
+@csrf_protection
+@auth.login_required
+def export_request_list():
+    """
+    Stream requests as newline delimited JSON (default) or CSV
+    (format=csv). Requests can be filtered by client, product_area,
+    date_from, date_to (mm/dd/yyyy) and status (active, completed).
+
+    :return Response:
+    """
+    args = request.args
+    filters = dict()
+
+    for name, key in (('client', 'client_id'), ('product_area', 'area_id')):
+        if args.get(name):
+            if not is_index(args[name]):
+                return jsonify({'error': "Cannot read %s id" % name}), 200
+            filters[key] = int(args[name])
+
+    for name in ('date_from', 'date_to'):
+        if args.get(name):
+            filters[name] = convert_date(args[name])
+            if filters[name] is None:
+                return jsonify({'error': "Date format is mm/dd/yyyy"}), 200
+
+    status = args.get('status')
+    if status not in (None, 'active', 'completed'):
+        return jsonify({'error': "Unknown status"}), 200
+    if status:
+        filters['is_active'] = status == 'active'
+
+    rows = export_requests(**filters)
+
+    if args.get('format') == 'csv':
+        def generate():
+            yield to_csv_line(EXPORT_COLUMNS)
+            for row in rows:
+                yield to_csv_line([
+                    row['id'], row['title'], row['description'],
+                    row['client']['id'], row['client']['name'],
+                    row['client_priority'],
+                    row['target_date'].strftime('%m/%d/%Y'),
+                    row['product_area']['id'], row['product_area']['name'],
+                    int(row['is_active'])])
+        mimetype = 'text/csv'
+    else:
+        def generate():
+            for row in rows:
+                yield json_dumps(row) + '\n'
+        mimetype = 'application/x-ndjson'
+
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=requests.%s' % (
+            'csv' if mimetype == 'text/csv' else 'ndjson')
+    return response
 
 
 @app.route('/requests/edit', methods=['POST'])
@@ -702,16 +1084,18 @@ def update_request_info():
 
     user_request['id'] = int(request_id)
 
-    if not request_exist(request_id):
+    if not g.checks['request']:
         return jsonify({'error': "Cannot find the request"}), 200
 
-    if client_priority_is_taken(user_request):
-        update_client_priorities(user_request)
+    shifted = list()
+    if g.checks['taken']:
+        shifted = update_client_priorities(user_request)
 
     # clean RAM
     del g.user_request
 
-    return jsonify(update_request(user_request)), 200
+    result = update_request(user_request, is_delta(), shifted)
+    return jsonify(result), 200
 
 
 @app.route('/requests/delete', methods=['POST'])
@@ -739,7 +1123,7 @@ def remove_request_info():
     if not request_exist(data.get('id')):
         return jsonify({'error': 'Cannot find the request'}), 200
 
-    return jsonify(remove_request(data.get("id"))), 200
+    return jsonify(remove_request(data.get("id"), is_delta())), 200
 
 
 @app.route('/requests/complete', methods=['POST'])
@@ -768,31 +1152,94 @@ def complete_the_request():
     if not request_exist(request_id):
         return jsonify({'error': "Cannot find the request"}), 200
 
-    return jsonify(completed_request(request_id)), 200
+    return jsonify(completed_request(request_id, is_delta())), 200
 
 
 @app.route('/requests')
 @csrf_protection
 @auth.login_required
+@conditional_get('request')
 def get_all_requests():
     """
-    Return all request in JSON format
+    Return all request in JSON format, or a page of requests
+    if limit parameter is given
 
     :return String: (JSON)
     """
-    return jsonify(get_requests()), 200
+    return get_page(True)
 
 
 @app.route('/requests/get/completed')
 @csrf_protection
 @auth.login_required
+@conditional_get('request')
 def get_all_completed_requests():
     """
-    Return all completed requests in JSON format
+    Return all completed requests in JSON format, or a page
+    of completed requests if limit parameter is given
+
+    :return String: (JSON)
+    """
+    return get_page(False)
+
+
+@app.route('/requests/stream')
+@csrf_protection
+@login_required
+def stream_requests():
+    """
+    Server-Sent Events of changes of the requests list. Events
+    create, update, complete and delete have the same data as
+    delta responses, shift has pairs [id, client_priority] of
+    requests with shifted priority, reset means that the list
+    has to be loaded again.
+
+    :return Response:
+    """
+    def generate():
+        queue = request_events.subscribe()
+        try:
+            yield 'retry: %d\n\n' % STREAM_RETRY
+            while True:
+                try:
+                    name, data = queue.get(timeout=STREAM_KEEP_ALIVE)
+                except Empty:
+                    name, data = None, None
+
+                if not request_events.is_subscribed(queue):
+                    # events were lost, the subscriber was too slow
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+
+                if name is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield 'event: %s\nid: %s\ndata: %s\n\n' % (
+                        name, data['version'], json_dumps(data))
+        finally:
+            request_events.unsubscribe(queue)
+
+    # do not keep a database connection while the stream is open
+    db_session.remove()
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/status/pool')
+@csrf_protection
+@auth.login_required
+def get_pool_info():
+    """
+    Return state of the database connection pool and
+    time of waiting for a connection in JSON format
 
     :return String: (JSON)
     """
-    return jsonify(get_completed_requests()), 200
+    return jsonify(get_pool_status(engine)), 200
 
 
 if __name__ == '__main__':
@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from os import path
+from time import time
+from threading import Lock
 from settings import SAME_THREAD, CONNECT_SETTINGS
 from sqlalchemy.ext.declarative import declarative_base
-from settings import POSTGRES, DB_FILE_NAME
+from sqlalchemy.pool import QueuePool
+from settings import POSTGRES, DB_FILE_NAME, SQLITE_TIMEOUT, \
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, POOL_SIZE, \
+    POOL_MAX_OVERFLOW, POOL_TIMEOUT, POOL_RECYCLE, POOL_PRE_PING
 
 Base = declarative_base()
 cur_dir = path.dirname(path.abspath(__file__))
@@ -18,3 +23,77 @@ if POSTGRES:
     DB_SETTINGS = CONNECT_SETTINGS
 else:
     DB_SETTINGS = SQLite % (path.join(cur_dir, DB_FILE_NAME), cst)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    Queue pool which measures how long threads wait for a connection,
+    every pool keeps its own statistics
+    """
+
+    def __init__(self, creator, **kw):
+        QueuePool.__init__(self, creator, **kw)
+        self.lock = Lock()
+        self.stats = {'checkouts': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+    def _do_get(self):
+        start = time()
+        try:
+            return QueuePool._do_get(self)
+        finally:
+            wait = time() - start
+            with self.lock:
+                self.stats['checkouts'] += 1
+                self.stats['wait_total'] += wait
+                self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+
+
+ENGINE_SETTINGS = {
+    'poolclass': TimedQueuePool,
+    'pool_size': POOL_SIZE,
+    'max_overflow': POOL_MAX_OVERFLOW,
+    'pool_timeout': POOL_TIMEOUT,
+    'pool_recycle': POOL_RECYCLE,
+    'pool_pre_ping': POOL_PRE_PING
+}
+
+if not POSTGRES:
+    ENGINE_SETTINGS['connect_args'] = {'timeout': SQLITE_TIMEOUT}
+
+
+def set_sqlite_pragma(connection, record):
+    """
+    Configure a new SQLite connection: journal mode,
+    synchronous mode and cache size
+
+    :param connection: DBAPI connection
+    :param record: connection record
+    :return void:
+    """
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode=%s' % SQLITE_JOURNAL_MODE)
+    cursor.execute('PRAGMA synchronous=%s' % SQLITE_SYNCHRONOUS)
+    cursor.execute('PRAGMA cache_size=%d' % SQLITE_CACHE_SIZE)
+    cursor.close()
+
+
+def get_pool_status(engine):
+    """
+    Returns state of the connection pool and how long
+    threads waited for a connection
+
+    :param engine: Engine object
+    :return dict:
+    """
+    pool = engine.pool
+    with pool.lock:
+        stats = dict(pool.stats)
+    checkouts = stats['checkouts']
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'checkouts': checkouts,
+        'wait_avg': stats['wait_total'] / checkouts if checkouts else 0.0,
+        'wait_max': stats['wait_max']
+    }
@@ -1,19 +1,144 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from models import User, ProductArea, Client, Request, session, Priority
+from functools import wraps
+from bisect import bisect_left
+from sqlalchemy import func, or_, and_, bindparam, exists, select, \
+    literal, inspect
+from sqlalchemy.orm import joinedload
+from models import User, ProductArea, Client, Request, session, Priority, \
+    Version, replicas, needs_rehash
+from resource import make_cursor, Cache, EventStream
+from settings import SPARSE_RANKS, RANK_GAP, IMPORT_CHUNK_SIZE, \
+    EXPORT_CHUNK_SIZE, REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL, \
+    STREAM_QUEUE_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL, TOKEN_VERSION_TTL
 
 query = session.query
+client_cache = Cache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL)
+area_cache = Cache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL)
+request_events = EventStream(STREAM_QUEUE_SIZE)
+user_cache = Cache(USER_CACHE_SIZE, USER_CACHE_TTL)
+token_versions = Cache(USER_CACHE_SIZE, TOKEN_VERSION_TTL)
+
+
+def read_replica(f):
+    """
+    Run read-only function on a read replica, if replicas are
+    configured. The session which wrote recently still reads
+    from the primary database.
+
+    :param f: function
+    :return function:
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not replicas:
+            return f(*args, **kwargs)
+
+        current = session()
+        previous = current.use_replica
+        current.use_replica = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            current.use_replica = previous
+
+    return decorated_function
+
+
+def get_version(name):
+    """
+    Returns version number of the list by table name
+
+    :param name: string
+    :return integer:
+    """
+    version = query(Version.value).filter_by(name=name).scalar()
+    return version or 0
+
+
+def get_versions(*names):
+    """
+    Returns version numbers of the lists by table names
+    in one query
+
+    :param names: strings
+    :return dict:
+    """
+    rows = query(Version.name, Version.value).filter(
+        Version.name.in_(names)).all()
+    versions = dict((name, 0) for name in names)
+    versions.update(rows)
+    return versions
+
+
+def bump_version(*names):
+    """
+    Increase version numbers of the lists by table names,
+    changes are saved with the next commit
+
+    :param names: strings
+    :return void:
+    """
+    for name in names:
+        updated = query(Version).filter_by(name=name).update(
+            {Version.value: Version.value + 1}, synchronize_session=False)
+        if not updated:
+            session.add(Version(name=name, value=1))
 
 
 def get_user_by_id(uid):
     """
-    Returns user by user id
+    Returns user by user id. Users are cached detached from the
+    session, the cached user is merged to the current session
+    without a query.
 
     :param uid: integer
     :return return: object
     """
-    return query(User).filter_by(id=uid).first() or None
+    user = user_cache.get(uid)
+    if user is None:
+        user = query(User).filter_by(id=uid).first()
+        if user is None:
+            return None
+        # detached user is not expired by commits of other requests
+        session.expunge(user)
+        user_cache.set(uid, user)
+    return session.merge(user, load=False)
+
+
+def get_token_version(uid):
+    """
+    Returns token version of the user, the version is cached,
+    so valid tokens are checked without a query
+
+    :param uid: integer
+    :return integer or None: None if the user does not exist
+    """
+    version = token_versions.get(uid)
+    if version is None:
+        row = query(User.token_version).filter_by(id=uid).first()
+        if row is None:
+            return None
+        version = row.token_version or 0
+        token_versions.set(uid, version)
+    return version
+
+
+def revoke_tokens(uid):
+    """
+    Make all auth tokens of the user invalid
+
+    :param uid: integer
+    :return void:
+    """
+    query(User).filter_by(id=uid).update(
+        {User.token_version: func.coalesce(User.token_version, 0) + 1},
+        synchronize_session=False)
+    session.commit()
+    token_versions.delete(uid)
+    user_cache.delete(uid)
 
 
 def get_user_by_email(email):
@@ -45,7 +170,8 @@ def create_user(email, password, first_name, last_name):
 
 def update_user(usr):
     """
-    Update user and return new data
+    Update user and return new data. If the password is changed
+    all auth tokens of the user are revoked.
 
     :param usr: dictionary
     :return object:
@@ -54,6 +180,7 @@ def update_user(usr):
     user = session.query(User).filter_by(id=usr['uid']).first()
     if usr['password']:
         user.hash_password(usr['password'])
+        user.token_version = (user.token_version or 0) + 1
     if usr['email']:
         user.email = usr['email']
     if usr['first_name']:
@@ -62,9 +189,26 @@ def update_user(usr):
         user.last_name = usr['last_name']
 
     session.commit()
+    user_cache.delete(user.id)
+    token_versions.delete(user.id)
     return user
 
 
+def rehash_password(user, password):
+    """
+    Hash the password again, if the stored hash was made with
+    other Argon2 parameters. Call it after successful login.
+
+    :param user: User object
+    :param password: string
+    :return void:
+    """
+    if needs_rehash(user.hash):
+        user.hash_password(password)
+        session.commit()
+        user_cache.delete(user.id)
+
+
 def remove_user(uid):
     """
     Remove user by user id
@@ -75,6 +219,8 @@ def remove_user(uid):
     user = session.query(User).filter_by(id=uid).first()
     session.delete(user)
     session.commit()
+    user_cache.delete(uid)
+    token_versions.delete(uid)
 
 
 def create_client(name):
@@ -86,29 +232,100 @@ def create_client(name):
     """
     client = Client(name=name)
     session.add(client)
+    bump_version('client')
     session.commit()
+    client_cache.delete(client.id)
     return client
 
 
+def get_client_info(client_id):
+    """
+    Returns id and name of the client from the cache, on a cache
+    miss the client is read from the database. Other processes
+    see changes after REFERENCE_CACHE_TTL, so lists are serialized
+    from rows loaded with requests.
+
+    :param client_id: integer
+    :return dict or None: None if the client does not exist
+    """
+    info = client_cache.get(client_id)
+    if info is None:
+        client = query(Client).filter_by(id=client_id).first()
+        if client is None:
+            return None
+        info = {'id': client.id, 'name': client.name}
+        client_cache.set(client_id, info)
+    return info
+
+
+def get_client_priorities(client_ids=None):
+    """
+    Count active requests of every client in one grouped query
+    and return the next free client priority by client id. If
+    client_ids is given only these clients are counted.
+
+    :param client_ids: list of client ids or None for all clients
+    :return dict:
+    """
+    if client_ids is not None and not client_ids:
+        return dict()
+
+    rows = query(Request.client, func.count(Request.id)).filter_by(
+        is_active=True)
+    if client_ids is not None:
+        rows = rows.filter(Request.client.in_(client_ids))
+    rows = rows.group_by(Request.client).all()
+    return dict((client, amount + 1) for client, amount in rows)
+
+
+@read_replica
 def get_clients():
     """
     Get all clients and serialize it
 
     :return object:
     """
-    return [request.serialize for request in query(Client).all()]
+    priorities = get_client_priorities()
+    return [client.serialize_with(priorities.get(client.id, 1))
+            for client in query(Client).all()]
 
 
-def update_client(client_info):
+def get_clients_delta(ids, removed=None, priorities=None):
     """
-    Update client and return list of clients
+    Get only changed clients and version of the clients list
+
+    :param ids: list of ids of changed clients
+    :param removed: list of ids of removed clients
+    :param priorities: dict, client priorities already counted
+    :return dict:
+    """
+    if priorities is None:
+        priorities = get_client_priorities(ids)
+    clients = query(Client).filter(Client.id.in_(ids)).all() if ids else []
+    return {
+        'version': get_version('client'),
+        'clients': [client.serialize_with(priorities.get(client.id, 1))
+                    for client in clients],
+        'removed': removed or []
+    }
+
+
+def update_client(client_info, delta=False):
+    """
+    Update client and return list of clients, or only
+    the changed client if delta is True
 
     :param client_info: dict
+    :param delta: bool
     :return object:
     """
     client = session.query(Client).filter_by(id=client_info['id']).first()
     client.name = client_info['name']
+    bump_version('client', 'request')
     session.commit()
+    client_cache.delete(client.id)
+    if delta:
+        return get_clients_delta([client.id])
     return get_clients()
 
 
@@ -119,22 +336,48 @@ def check_client_relation(client_id):
     :param client_id: integer
     :return bool:
     """
-    return len(query(Request).filter_by(client=client_id).all()) > 0
+    return session.query(
+        exists().where(Request.client == client_id)).scalar()
 
 
-def remove_client(client_id):
+def count_client_relation(client_id):
     """
-    Remove client by client id and return list of clients
+    Count requests which use current client
 
     :param client_id: integer
-    :return void:
+    :return integer:
+    """
+    return query(func.count(Request.id)).filter_by(client=client_id).scalar()
+
+
+def remove_client(client_id, delta=False):
+    """
+    Remove client by client id and return list of clients,
+    or only id of the removed client if delta is True
+
+    :param client_id: integer
+    :param delta: bool
+    :return object:
     """
     client = query(Client).filter_by(id=client_id).first()
     session.delete(client)
+    bump_version('client')
     session.commit()
+    client_cache.delete(client_id)
+    if delta:
+        return get_clients_delta([], removed=[client_id])
     return get_clients()
 
 
+def get_client_ids():
+    """
+    Returns ids of all clients
+
+    :return set:
+    """
+    return set(row.id for row in query(Client.id))
+
+
 def client_exist(client_id):
     """
     Check client by id
@@ -142,7 +385,7 @@ def client_exist(client_id):
     :param client_id: integer
     :return: bool
     """
-    return True if query(Client).filter_by(id=client_id).first() else False
+    return get_client_info(client_id) is not None
 
 
 def create_product_area(name):
@@ -154,10 +397,31 @@ def create_product_area(name):
     """
     product_area = ProductArea(name=name)
     session.add(product_area)
+    bump_version('product_area')
     session.commit()
+    area_cache.delete(product_area.id)
     return product_area
 
 
+def get_product_area_info(area_id):
+    """
+    Returns serialized product area from the cache, on a cache
+    miss the product area is read from the database
+
+    :param area_id: integer
+    :return dict or None: None if the product area does not exist
+    """
+    info = area_cache.get(area_id)
+    if info is None:
+        product_area = query(ProductArea).filter_by(id=area_id).first()
+        if product_area is None:
+            return None
+        info = product_area.serialize
+        area_cache.set(area_id, info)
+    return info
+
+
+@read_replica
 def get_product_areas():
     """
     Get all product areas and serialize it
@@ -167,6 +431,15 @@ def get_product_areas():
     return [area.serialize for area in query(ProductArea).all()]
 
 
+def get_product_area_ids():
+    """
+    Returns ids of all product areas
+
+    :return set:
+    """
+    return set(row.id for row in query(ProductArea.id))
+
+
 def product_area_exist(area_id):
     """
     Check product area by id
@@ -174,19 +447,43 @@ def product_area_exist(area_id):
     :param area_id: integer
     :return: bool
     """
-    return True if query(ProductArea).filter_by(id=area_id).first() else False
+    return get_product_area_info(area_id) is not None
+
+
+def get_product_areas_delta(ids, removed=None):
+    """
+    Get only changed product areas and version of the
+    product areas list
+
+    :param ids: list of ids of changed product areas
+    :param removed: list of ids of removed product areas
+    :return dict:
+    """
+    areas = query(ProductArea).filter(
+        ProductArea.id.in_(ids)).all() if ids else []
+    return {
+        'version': get_version('product_area'),
+        'areas': [area.serialize for area in areas],
+        'removed': removed or []
+    }
 
 
-def update_product_area(area):
+def update_product_area(area, delta=False):
     """
-    Update product area and return list of product areas
+    Update product area and return list of product areas,
+    or only the changed product area if delta is True
 
     :param area: dict
+    :param delta: bool
     :return object:
     """
     product_area = session.query(ProductArea).filter_by(id=area['id']).first()
     product_area.name = area['name']
+    bump_version('product_area', 'request')
     session.commit()
+    area_cache.delete(product_area.id)
+    if delta:
+        return get_product_areas_delta([product_area.id])
     return get_product_areas()
 
 
@@ -197,19 +494,37 @@ def check_product_area_relation(area_id):
     :param area_id: integer
     :return bool:
     """
-    return len(query(Request).filter_by(product_area=area_id).all()) > 0
+    return session.query(
+        exists().where(Request.product_area == area_id)).scalar()
 
 
-def remove_product_area(area_id):
+def count_product_area_relation(area_id):
     """
-    Remove product area by id
+    Count requests which use current product area
 
     :param area_id: integer
-    :return void:
+    :return integer:
+    """
+    return query(func.count(Request.id)).filter_by(
+        product_area=area_id).scalar()
+
+
+def remove_product_area(area_id, delta=False):
+    """
+    Remove product area by id and return list of product
+    areas, or only id of the removed area if delta is True
+
+    :param area_id: integer
+    :param delta: bool
+    :return object:
     """
     product_area = session.query(ProductArea).filter_by(id=area_id).first()
     session.delete(product_area)
+    bump_version('product_area')
     session.commit()
+    area_cache.delete(area_id)
+    if delta:
+        return get_product_areas_delta([], removed=[area_id])
     return get_product_areas()
 
 
@@ -224,6 +539,22 @@ def create_priority():
     return query(Priority).all()
 
 
+def create_priorities(amount):
+    """
+    Make sure that priorities from 1 to amount exist, missing
+    priorities are created with one bulk insert, changes are
+    saved with the next commit
+
+    :param amount: integer
+    :return void:
+    """
+    last = query(func.max(Priority.id)).scalar() or 0
+    if amount > last:
+        session.execute(Priority.__table__.insert(),
+                        [{'id': index} for index in xrange(last + 1,
+                                                           amount + 1)])
+
+
 def check_create_priority(priority_id):
     """
     Make sure that property exist, if not create a new one
@@ -231,50 +562,452 @@ def check_create_priority(priority_id):
     :param priority_id: integer
     :return void:
     """
-    if not query(Priority).filter_by(id=priority_id).first():
-        create_priority()
+    create_priorities(priority_id)
+
+
+def query_requests():
+    """
+    Returns query of requests which loads client and product
+    area of each request in the same SELECT
+
+    :return object:
+    """
+    return query(Request).options(
+        joinedload(Request.client_info),
+        joinedload(Request.product_area_info))
+
+
+def order_column():
+    """
+    Returns column which defines order of requests of a client
+
+    :return object:
+    """
+    return Request.sort_rank if SPARSE_RANKS else Request.client_priority
+
+
+def rank_position():
+    """
+    Returns client priority from 1 to N counted from sparse rank
+    keys, as a window over requests of the client
+
+    :return object:
+    """
+    return func.row_number().over(
+        partition_by=(Request.client, Request.is_active),
+        order_by=(Request.sort_rank.asc(), Request.id.asc())
+    ).label('position')
+
+
+def by_priority(requests):
+    """
+    Sort serialized requests by client priority and id, the
+    order of lists in both rank modes
+
+    :param requests: list of dictionaries
+    :return list:
+    """
+    return sorted(requests,
+                  key=lambda item: (item['client_priority'], item['id']))
+
+
+def get_dense_priorities(requests, full=False):
+    """
+    Returns client priorities from 1 to N of requests ordered by
+    sparse rank keys. If full is True, requests is the full list
+    ordered by rank, and priorities are counted without a query.
+
+    :param requests: list of Request objects
+    :param full: bool
+    :return dict: request id -> client priority
+    """
+    positions = dict()
 
+    if full:
+        counters = dict()
+        for request in requests:
+            counters[request.client] = counters.get(request.client, 0) + 1
+            positions[request.id] = counters[request.client]
+        return positions
+
+    if not requests:
+        return positions
+
+    clients = set(request.client for request in requests)
+    ranks = query(Request.id.label('id'), rank_position()).filter(
+        Request.client.in_(clients)).subquery()
+    rows = query(ranks.c.id, ranks.c.position).filter(
+        ranks.c.id.in_([request.id for request in requests]))
+
+    return dict((row.id, row.position) for row in rows)
+
+
+def loaded_relation(request, name):
+    """
+    Returns related object of the request if it was loaded
+    with the request, otherwise None
 
+    :param request: Request object
+    :param name: string, name of the relationship
+    :return object:
+    """
+    if name in inspect(request).unloaded:
+        return None
+    return getattr(request, name)
+
+
+def serialize_requests(requests, full=False, priorities=None,
+                       positions=None):
+    """
+    Serialize list of requests, every client and product area
+    is serialized only once for the whole list
+
+    :param requests: list of Request objects
+    :param full: bool, requests is the full list of active or
+                 completed requests
+    :param priorities: dict, client priorities already counted
+    :param positions: dict, request id -> client priority counted
+                      from rank keys
+    :return list:
+    """
+    if priorities is None:
+        priorities = get_client_priorities(
+            None if full else list(set(item.client for item in requests)))
+    clients = dict()
+    areas = dict()
+    result = list()
+
+    if positions is None:
+        positions = dict()
+        if SPARSE_RANKS:
+            positions = get_dense_priorities(requests, full)
+
+    for request in requests:
+        if request.client not in clients:
+            client = loaded_relation(request, 'client_info')
+            if client is None:
+                client = get_client_info(request.client)
+            else:
+                client = {'id': client.id, 'name': client.name}
+            clients[request.client] = dict(
+                client, client_priority=priorities.get(request.client, 1))
+        if request.product_area not in areas:
+            area = loaded_relation(request, 'product_area_info')
+            if area is None:
+                area = get_product_area_info(request.product_area)
+            else:
+                area = area.serialize
+            areas[request.product_area] = area
+
+        result.append(request.serialize_with(
+            clients[request.client], areas[request.product_area],
+            positions.get(request.id)))
+
+    return result
+
+
+@read_replica
 def get_requests():
     """
     Get all requests and serialize them
 
     :return object:
     """
-    requests = query(Request).filter_by(
-        is_active=True).order_by(Request.client_priority.asc()).all()
-    return [request.serialize for request in requests]
+    requests = query_requests().filter_by(is_active=True).order_by(
+        order_column().asc(), Request.id.asc()).all()
+    return by_priority(serialize_requests(requests, full=True))
 
 
+@read_replica
 def get_completed_requests():
     """
     Get all completed requests and serialize them
 
     :return object:
     """
-    requests = query(Request).filter_by(
-        is_active=False).order_by(Request.client_priority.asc()).all()
-    return [request.serialize for request in requests]
+    requests = query_requests().filter_by(is_active=False).order_by(
+        order_column().asc(), Request.id.asc()).all()
+    return by_priority(serialize_requests(requests, full=True))
 
 
-def completed_request(request_id):
+@read_replica
+def get_requests_page(is_active, limit, after=None):
+    """
+    Get one page of requests ordered by client priority and id.
+    Uses keyset pagination, so the page is found by the index
+    without counting skipped rows. With sparse rank keys client
+    priorities are counted by a window over the list.
+
+    :param is_active: boolean
+    :param limit: integer
+    :param after: tuple (client priority, id) of the last row
+    :return dict:
+        :arg requests: list of serialized requests
+        :arg next: cursor string for next page or None
+    """
+    requests = query_requests().filter(Request.is_active == is_active)
+
+    if SPARSE_RANKS:
+        ranks = query(Request.id.label('id'), rank_position()).filter(
+            Request.is_active == is_active).subquery()
+        column = ranks.c.position
+        requests = requests.join(ranks, ranks.c.id == Request.id) \
+            .add_columns(column)
+    else:
+        column = Request.client_priority
+
+    if after:
+        value, request_id = after
+        requests = requests.filter(or_(
+            column > value,
+            and_(column == value, Request.id > request_id)))
+
+    rows = requests.order_by(
+        column.asc(), Request.id.asc()).limit(limit + 1).all()
+
+    positions = None
+    if SPARSE_RANKS:
+        positions = dict((request.id, position)
+                         for request, position in rows)
+        rows = [request for request, position in rows]
+
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        cursor = make_cursor(
+            positions[last.id] if SPARSE_RANKS else last.client_priority,
+            last.id)
+
+    return {'requests': serialize_requests(rows, positions=positions),
+            'next': cursor}
+
+
+def export_requests(client_id=None, area_id=None, date_from=None,
+                    date_to=None, is_active=None,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generator of serialized requests for export. Rows are read
+    from the database in chunks (server-side cursor on PostgreSQL)
+    and serialized chunk by chunk, so memory does not depend on
+    the amount of exported requests.
+
+    :param client_id: integer, filter by client
+    :param area_id: integer, filter by product area
+    :param date_from: date, filter by target date
+    :param date_to: date, filter by target date
+    :param is_active: bool, filter by status
+    :param chunk_size: integer
+    :return generator:
     """
-    Mark the request as completed
+    requests = query_requests()
+
+    if client_id:
+        requests = requests.filter(Request.client == client_id)
+    if area_id:
+        requests = requests.filter(Request.product_area == area_id)
+    if date_from:
+        requests = requests.filter(Request.target_date >= date_from)
+    if date_to:
+        requests = requests.filter(Request.target_date <= date_to)
+    if is_active is not None:
+        requests = requests.filter(Request.is_active == is_active)
+
+    # client priorities are counted once for all chunks
+    priorities = get_client_priorities([client_id] if client_id else None)
+    if SPARSE_RANKS:
+        ranks = query(Request.id.label('id'), rank_position()).subquery()
+        requests = requests.join(ranks, ranks.c.id == Request.id) \
+            .add_columns(ranks.c.position)
+
+    def serialize(rows):
+        positions = None
+        if SPARSE_RANKS:
+            positions = dict((request.id, position)
+                             for request, position in rows)
+            rows = [request for request, position in rows]
+        return serialize_requests(rows, priorities=priorities,
+                                  positions=positions)
+
+    chunk = list()
+    for row in requests.order_by(Request.id.asc()).yield_per(chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            for item in serialize(chunk):
+                yield item
+            chunk = list()
+
+    for item in serialize(chunk):
+        yield item
+
+
+def get_requests_delta(ids, removed=None, client_ids=None):
+    """
+    Get only changed requests, clients whose client priority
+    could be changed, and version of the requests list
+
+    :param ids: list of ids of changed requests
+    :param removed: list of ids of removed requests
+    :param client_ids: list of ids of clients of removed requests
+    :return dict:
+    """
+    requests = query_requests().filter(
+        Request.id.in_(ids)).all() if ids else []
+    client_ids = set(client_ids or [])
+    client_ids.update(request.client for request in requests)
+    priorities = get_client_priorities(list(client_ids))
+    delta = get_clients_delta(list(client_ids), priorities=priorities)
+    return {
+        'version': get_version('request'),
+        'requests': serialize_requests(requests, priorities=priorities),
+        'removed': removed or [],
+        'clients': delta['clients']
+    }
+
+
+def publish_requests(name, ids, removed=None, client_ids=None,
+                     shifted=None):
+    """
+    Publish change of requests list to the subscribers of the
+    stream. Shifted client priorities are sent first as a
+    separate "shift" event with pairs [id, client_priority].
+    Nothing is read from the database if nobody is subscribed.
+
+    :param name: string, event name
+    :param ids: list of ids of changed requests
+    :param removed: list of ids of removed requests
+    :param client_ids: list of ids of clients of removed requests
+    :param shifted: list of ids of requests with shifted priority
+    :return void:
+    """
+    if not request_events.subscribers:
+        return
+
+    if shifted:
+        requests = query(Request).filter(Request.id.in_(shifted)).all()
+        if SPARSE_RANKS:
+            positions = get_dense_priorities(requests)
+        else:
+            positions = dict((request.id, request.client_priority)
+                             for request in requests)
+        request_events.publish('shift', {
+            'version': get_version('request'),
+            'requests': [[request_id, position] for request_id, position
+                         in sorted(positions.items())]
+        })
+
+    request_events.publish(name, get_requests_delta(ids, removed, client_ids))
+
+
+def completed_request(request_id, delta=False):
+    """
+    Mark the request as completed and return list of
+    requests, or only the changed request if delta is True
 
-    :param request_id:
+    :param request_id: integer
+    :param delta: bool
     :return:
     """
     current_request = query(Request).filter_by(id=request_id).first()
     current_request.is_active = False
+    bump_version('request', 'client')
     session.commit()
+    publish_requests('complete', [request_id])
+    if delta:
+        return get_requests_delta([request_id])
     return get_requests()
 
 
-def create_request(data):
+def renumber_ranks(client_id=None):
+    """
+    Spread rank keys of requests evenly with RANK_GAP between
+    neighbours, keeping the current order. Requests without a
+    rank key are placed by their client priority.
+
+    :param client_id: integer, if None renumber all clients
+    :return void:
     """
-    Creates a new request and return list of requests
+    requests = query(Request.id, Request.client, Request.is_active)
+    if client_id:
+        requests = requests.filter(Request.client == client_id)
+    requests = requests.order_by(
+        Request.client, Request.is_active,
+        func.coalesce(Request.sort_rank,
+                      Request.client_priority * RANK_GAP),
+        Request.id)
+
+    counters = dict()
+    ranks = list()
+    for row in requests:
+        key = (row.client, row.is_active)
+        counters[key] = counters.get(key, 0) + 1
+        ranks.append({'request_id': row.id,
+                      'rank': counters[key] * RANK_GAP})
+
+    if ranks:
+        table = Request.__table__
+        session.execute(table.update().where(
+            table.c.id == bindparam('request_id')).values(
+            sort_rank=bindparam('rank')), ranks)
+    session.commit()
+
+
+def get_rank(client_id, client_priority, request_id=None):
+    """
+    Returns rank key for a request placed on given client
+    priority among active requests of the client. If there is
+    no gap between neighbours, ranks of the client are
+    renumbered.
+
+    :param client_id: integer
+    :param client_priority: integer
+    :param request_id: integer, id of the moved request
+    :return integer:
+    """
+    requests = query(Request.sort_rank).filter(
+        Request.client == client_id, Request.is_active == True)
+    if request_id:
+        requests = requests.filter(Request.id != request_id)
+
+    # requests created before sparse ranks were turned on
+    if requests.filter(Request.sort_rank.is_(None)).first():
+        renumber_ranks(client_id)
+
+    ranks = [row.sort_rank for row in requests.order_by(
+        Request.sort_rank.asc(), Request.id.asc()).offset(
+        max(client_priority - 2, 0)).limit(2)]
+
+    if client_priority == 1:
+        before, after = None, ranks[0] if ranks else None
+    elif len(ranks) == 2:
+        before, after = ranks
+    elif ranks:
+        before, after = ranks[0], None
+    else:
+        # the request is placed after the last one
+        before = requests.with_entities(func.max(Request.sort_rank)).scalar()
+        after = None
+
+    if before is None and after is None:
+        return RANK_GAP
+    if before is None:
+        return after - RANK_GAP
+    if after is None:
+        return before + RANK_GAP
+    if after - before < 2:
+        renumber_ranks(client_id)
+        return get_rank(client_id, client_priority, request_id)
+    return (before + after) // 2
+
+
+def create_request(data, delta=False, shifted=None):
+    """
+    Creates a new request and return list of requests, or only
+    the new and shifted requests if delta is True
 
     :param data: dictionary
+    :param delta: bool
+    :param shifted: list of ids of requests with shifted priority
     :return object:
     """
     check_create_priority(data['client_priority'])
@@ -287,14 +1020,23 @@ def create_request(data):
         target_date=data['target_date'],
         product_area=data['product_area']
     )
+    if SPARSE_RANKS:
+        new_request.sort_rank = get_rank(
+            data['client'], data['client_priority'])
     session.add(new_request)
+    bump_version('request', 'client')
     session.commit()
+    publish_requests('create', [new_request.id], shifted=shifted)
+    if delta:
+        return get_requests_delta([new_request.id] + list(shifted or []))
     return get_requests()
 
 
-def update_request(request):
+def update_request(request, delta=False, shifted=None):
     """
-    Update request information in database, and re
+    Update request information in database, and return list of
+    requests, or only the updated and shifted requests if delta
+    is True
 
     :param request: dictionary
         :arg id: integer
@@ -304,19 +1046,32 @@ def update_request(request):
         :arg client_priority: integer
         :arg date: date object
         :arg product_area: integer (product area id)
+    :param delta: bool
+    :param shifted: list of ids of requests with shifted priority
     :return list:
     """
     check_create_priority(request['client_priority'])
 
     current_request = query(Request).filter_by(id=request['id']).first()
+    client_ids = [current_request.client]
+    if SPARSE_RANKS:
+        current_request.sort_rank = get_rank(
+            request['client'], request['client_priority'],
+            current_request.id)
     current_request.title = request['title']
     current_request.description = request['description']
     current_request.client = request['client']
     current_request.client_priority = request['client_priority']
     current_request.target_date = request['target_date']
     current_request.product_area = request['product_area']
+    bump_version('request', 'client')
     session.commit()
+    publish_requests('update', [current_request.id], client_ids=client_ids,
+                     shifted=shifted)
 
+    if delta:
+        ids = [current_request.id] + list(shifted or [])
+        return get_requests_delta(ids, client_ids=client_ids)
     return get_requests()
 
 
@@ -328,6 +1083,11 @@ def client_priority_is_taken(request):
     :param request: integer
     :return Boolean:
     """
+    if SPARSE_RANKS:
+        amount = query(func.count(Request.id)).filter_by(
+            client=request['client'], is_active=True).scalar()
+        return amount >= request['client_priority']
+
     request = query(Request).filter_by(
         client=request['client'],
         client_priority=request['client_priority']).first()
@@ -335,26 +1095,212 @@ def client_priority_is_taken(request):
     return True if request else False
 
 
+def check_request_data(req, request_id=None):
+    """
+    Check in one query that client and product area of the request
+    exist, that the request with request_id exists, and that the
+    client priority is taken
+
+    :param req: dict
+    :param request_id: integer or None
+    :return dict:
+        :arg client: bool, the client exists
+        :arg product_area: bool, the product area exists
+        :arg request: bool, the request exists (True if no request_id)
+        :arg taken: bool, the client priority is taken
+    """
+    if SPARSE_RANKS:
+        amount = select([func.count(Request.id)]).where(and_(
+            Request.client == req['client'],
+            Request.is_active == True)).as_scalar()
+        taken = amount >= req['client_priority']
+    else:
+        taken = exists().where(and_(
+            Request.client == req['client'],
+            Request.client_priority == req['client_priority']))
+
+    if request_id is None:
+        found = literal(True)
+    else:
+        found = exists().where(Request.id == request_id)
+
+    row = session.query(
+        exists().where(Client.id == req['client']).label('client'),
+        exists().where(
+            ProductArea.id == req['product_area']).label('product_area'),
+        found.label('request'),
+        taken.label('taken')).one()
+
+    return {
+        'client': bool(row.client),
+        'product_area': bool(row.product_area),
+        'request': bool(row.request),
+        'taken': bool(row.taken)
+    }
+
+
 def update_client_priorities(req):
     """
-    Get requests from database where client priority more or
-    equal given client_priority, then increase client
-    priority column on 1
+    Increase on 1 client priority of requests where client
+    priority more or equal given client_priority with one
+    UPDATE statement, and return ids of changed requests.
+
+    With sparse rank keys nothing is changed, only ids of
+    requests placed on given client priority or lower are
+    returned.
 
     :param req: dict
-    :return void:
+    :return list:
     """
-    requests = query(Request).filter(
-        Request.client_priority >= req["client_priority"],
-        Request.client == req["client"]
-    ).all()
+    if SPARSE_RANKS:
+        requests = query(Request.id).filter(
+            Request.client == req["client"],
+            Request.is_active == True).order_by(
+            Request.sort_rank.asc(), Request.id.asc()).offset(
+            req["client_priority"] - 1)
+        return [row.id for row in requests]
+
+    condition = (Request.client_priority >= req["client_priority"],
+                 Request.client == req["client"])
+    requests = query(Request.id, Request.client_priority).filter(
+        *condition).all()
+
+    if requests:
+        create_priorities(max(row.client_priority for row in requests) + 1)
+        query(Request).filter(*condition).update(
+            {Request.client_priority: Request.client_priority + 1},
+            synchronize_session=False)
+        bump_version('request')
 
-    for request in requests:
-        check_create_priority(request.client_priority + 1)
-        request.client_priority += 1
+    session.commit()
+    return [row.id for row in requests]
+
+
+def get_client_order(client_id):
+    """
+    Returns client priorities of requests of the client. With
+    sparse rank keys client priorities of active requests are
+    counted from 1 to N by rank.
+
+    :param client_id: integer
+    :return list: tuples (client priority, request id)
+    """
+    if SPARSE_RANKS:
+        requests = query(Request.id).filter(
+            Request.client == client_id, Request.is_active == True).order_by(
+            Request.sort_rank.asc(), Request.id.asc())
+        return [(index, row.id) for index, row in enumerate(requests, 1)]
 
+    requests = query(Request.client_priority, Request.id).filter(
+        Request.client == client_id)
+    return [(row.client_priority, row.id) for row in requests]
+
+
+def place_requests(existing, new_requests):
+    """
+    Place new requests of one client between existing requests.
+    If client priority of a new request is taken, the request
+    with this priority and every request below are shifted, the
+    same way as update_client_priorities does.
+
+    :param existing: list of tuples (client priority, request id)
+    :param new_requests: list of tuples (client priority, key)
+    :return dict: request id or key -> client priority
+    """
+    existing = sorted(existing)
+    priorities = [priority for priority, key in existing]
+    keys = [key for priority, key in existing]
+
+    for priority, key in new_requests:
+        index = bisect_left(priorities, priority)
+        if index < len(priorities) and priorities[index] == priority:
+            for position in xrange(index, len(priorities)):
+                priorities[position] += 1
+        priorities.insert(index, priority)
+        keys.insert(index, key)
+
+    return dict(zip(keys, priorities))
+
+
+def import_requests(requests, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Creates many requests with batched inserts, every chunk of
+    rows is saved in its own transaction. Client priorities are
+    resolved in memory for each client.
+
+    :param requests: list of dictionaries, like for create_request
+    :param chunk_size: integer
+    :return dict:
+        :arg created: amount of created requests
+        :arg shifted: amount of existing requests with changed
+                      client priority (or rank key)
+        :arg version: version of the requests list
+    """
+    new_requests = dict()
+    for index, data in enumerate(requests):
+        new_requests.setdefault(data['client'], []).append(
+            (data['client_priority'], -(index + 1)))
+
+    positions = dict()
+    changes = list()
+    for client_id, client_requests in new_requests.items():
+        existing = get_client_order(client_id)
+        client_positions = place_requests(existing, client_requests)
+        positions.update(client_positions)
+
+        for priority, request_id in existing:
+            position = client_positions[request_id]
+            if SPARSE_RANKS:
+                changes.append({'request_id': request_id,
+                                'value': position * RANK_GAP})
+            elif position != priority:
+                changes.append({'request_id': request_id, 'value': position})
+
+    rows = list()
+    for index, data in enumerate(requests):
+        position = positions[-(index + 1)]
+        rows.append({
+            'title': data['title'],
+            'description': data['description'],
+            'client': data['client'],
+            'client_priority': position,
+            'target_date': data['target_date'],
+            'product_area': data['product_area'],
+            'is_active': True,
+            'sort_rank': position * RANK_GAP if SPARSE_RANKS else None
+        })
+
+    if positions:
+        create_priorities(max(positions.values()))
+        session.commit()
+
+    table = Request.__table__
+    column = 'sort_rank' if SPARSE_RANKS else 'client_priority'
+    update = table.update().where(
+        table.c.id == bindparam('request_id')).values(
+        {column: bindparam('value')})
+
+    for start in xrange(0, len(changes), chunk_size):
+        session.execute(update, changes[start:start + chunk_size])
+        session.commit()
+
+    for start in xrange(0, len(rows), chunk_size):
+        session.execute(table.insert(), rows[start:start + chunk_size])
+        session.commit()
+
+    bump_version('request', 'client')
     session.commit()
 
+    # too many changes for one event, subscribers reload the list
+    if request_events.subscribers:
+        request_events.publish('reset', {'version': get_version('request')})
+
+    return {
+        'created': len(rows),
+        'shifted': len(changes),
+        'version': get_version('request')
+    }
+
 
 def request_exist(request_id):
     """
@@ -377,13 +1323,23 @@ def get_requests_by_id(request_id):
     return query(Request).filter_by(id=request_id).first()
 
 
-def remove_request(request_id):
+def remove_request(request_id, delta=False):
     """
-    Remove the request by id, and return list of requests
+    Remove the request by id, and return list of requests,
+    or only id of the removed request if delta is True
 
     :param request_id: integer
+    :param delta: bool
     :return list:
     """
-    session.delete(session.query(Request).filter_by(id=request_id).first())
+    current_request = session.query(Request).filter_by(id=request_id).first()
+    client_ids = [current_request.client]
+    session.delete(current_request)
+    bump_version('request', 'client')
     session.commit()
+    publish_requests('delete', [], removed=[int(request_id)],
+                     client_ids=client_ids)
+    if delta:
+        return get_requests_delta(
+            [], removed=[int(request_id)], client_ids=client_ids)
     return get_requests()
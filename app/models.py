@@ -1,33 +1,164 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey
+from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Date
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, Date, func, inspect, event
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session, \
+    Session
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from itsdangerous import BadSignature, SignatureExpired
+from itsdangerous import BadSignature, SignatureExpired, BadData, \
+    base64_decode
 
 from argon2.exceptions import VerifyMismatchError
 from argon2 import PasswordHasher
-from resource import get_unique_str
-from settings import POSTGRES
-from configure import DB_SETTINGS
+from sqlalchemy.exc import IntegrityError
+from logging import getLogger
+from random import choice
+from time import time
+from os import urandom
+from hashlib import sha256
+import hmac
+import re
+from json import loads
+from resource import Cache, WorkerPool
+from secrets import keys
+from settings import REPLICA_SETTINGS, STICKY_SECONDS, VERIFY_CACHE_SIZE, \
+    VERIFY_CACHE_TTL, ARGON2_TIME_COST, ARGON2_MEMORY_COST, \
+    ARGON2_PARALLELISM, ARGON2_HASH_LEN, ARGON2_SALT_LEN, HASH_WORKERS, \
+    HASH_QUEUE_LIMIT, HASH_TIMEOUT
+from configure import DB_SETTINGS, ENGINE_SETTINGS, set_sqlite_pragma
 
 Base = declarative_base()
-secret_key = get_unique_str(32)
-ph = PasswordHasher()
+log = getLogger(__name__)
+# serializers of auth tokens by key id
+serializers = dict((key_id, Serializer(key))
+                   for key_id, key in keys.token_keys.items())
+ph = PasswordHasher(time_cost=ARGON2_TIME_COST,
+                    memory_cost=ARGON2_MEMORY_COST,
+                    parallelism=ARGON2_PARALLELISM,
+                    hash_len=ARGON2_HASH_LEN,
+                    salt_len=ARGON2_SALT_LEN)
+hash_pool = WorkerPool(HASH_WORKERS, HASH_QUEUE_LIMIT, HASH_TIMEOUT)
+
+# successful verifications of passwords, the key of the HMAC lives
+# only in memory of the process
+verified = Cache(VERIFY_CACHE_SIZE, VERIFY_CACHE_TTL)
+verified_key = urandom(32)
+
+
+def hash_password(password):
+    """
+    Hash password with Argon2, runs in a process of the pool
+
+    :param password: string
+    :return string:
+    """
+    return ph.hash(password)
+
+
+def check_password(password_hash, password):
+    """
+    Verify password with Argon2, runs in a process of the pool
+
+    :param password_hash: string
+    :param password: string
+    :return bool:
+    """
+    try:
+        return ph.verify(password_hash, password)
+    except VerifyMismatchError:
+        return False
+
+
+def needs_rehash(password_hash):
+    """
+    Check that hash was made with other Argon2 parameters
+
+    :param password_hash: string
+    :return bool:
+    """
+    if hasattr(ph, 'check_needs_rehash'):
+        return ph.check_needs_rehash(password_hash)
+
+    match = re.match(r'^\$argon2i\$v=\d+\$m=(\d+),t=(\d+),p=(\d+)\$',
+                     password_hash or '')
+    if not match:
+        return True
+
+    return tuple(map(int, match.groups())) != (
+        ph.memory_cost, ph.time_cost, ph.parallelism)
+
+
+def get_key_id(token):
+    """
+    Read key id from the header of the token, the signature
+    is not checked
+
+    :param token: string
+    :return string or None:
+    """
+    try:
+        header = loads(base64_decode(str(token).split('.')[0]))
+    except (BadData, ValueError, TypeError, UnicodeError):
+        return None
+
+    key_id = header.get('kid') if isinstance(header, dict) else None
+    return key_id if isinstance(key_id, basestring) else None
+
+
+def create_db_engine(url):
+    """
+    Create an engine with pool settings, SQLite connections
+    are configured with pragmas
+
+    :param url: string
+    :return object:
+    """
+    db_engine = create_engine(url, **ENGINE_SETTINGS)
+    if db_engine.dialect.name == 'sqlite':
+        event.listen(db_engine, 'connect', set_sqlite_pragma)
+    return db_engine
+
+
+class RoutingSession(Session):
+    """
+    Session which sends reads to a read replica when use_replica
+    is set, unless the session wrote to the primary database less
+    than STICKY_SECONDS ago
+    """
+
+    use_replica = False
+    written_at = 0
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica and replicas and not self._flushing and \
+                time() - self.written_at > STICKY_SECONDS:
+            return choice(replicas)
+        return Session.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_write(current_session):
+    """
+    Remember time of the last commit for read-your-writes
+
+    :param current_session: RoutingSession object
+    :return void:
+    """
+    current_session.written_at = time()
 
 
 # create session
-if POSTGRES:
-    engine = create_engine(DB_SETTINGS)
-else:
-    engine = create_engine(DB_SETTINGS, connect_args={'timeout': 15})
+engine = create_db_engine(DB_SETTINGS)
+replicas = [create_db_engine(url) for url in REPLICA_SETTINGS]
 
 Base.metadata.bind = engine
-DBSession = sessionmaker(bind=engine)
-session = DBSession()
+DBSession = sessionmaker(bind=engine, class_=RoutingSession)
+
+# every thread gets its own session, the session is removed
+# at the end of each request by the application teardown
+session = scoped_session(DBSession)
 query = session.query
 
 
@@ -37,11 +168,13 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     first_name = Column(String(60))
     last_name = Column(String(60))
-    email = Column(String(45))
+    email = Column(String(45), index=True, unique=True)
     hash = Column(String(250))
     is_active = Column(Boolean, default=True)
     status = Column(Integer, default=3)
     role = Column(String(10), default='user')
+    # increased to revoke auth tokens of the user
+    token_version = Column(Integer, default=0)
 
     def hash_password(self, password):
         """
@@ -50,28 +183,43 @@ class User(Base):
         :param password: (str)
         :return void:
         """
-        self.hash = ph.hash(password)
+        self.hash = hash_pool.run(hash_password, password)
 
     def verify_password(self, password):
         """
-        Password verification
+        Password verification. Successful verifications are cached
+        by HMAC of user id, password hash and password, so the
+        cache is not valid after the password is changed.
 
         :param password:
         :return bool:
         """
-        try:
-            return ph.verify(self.hash, password)
-        except VerifyMismatchError:
-            return False
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        key = hmac.new(verified_key, '%s\0%s\0%s' % (
+            self.id, str(self.hash), password), sha256).digest()
+
+        if verified.get(key):
+            return True
+
+        result = hash_pool.run(check_password, self.hash, password)
+        if result:
+            verified.set(key, True)
+        return result
 
     def generate_auth_token(self):
         """
-        Generate authentication token
+        Generate authentication token with claims: user id, role,
+        status and token version of the user
 
         :return string: (token)
         """
-        s = Serializer(secret_key)
-        return s.dumps({'uid': self.id})
+        s = serializers[keys.token_key_id]
+        return s.dumps({'uid': self.id,
+                        'role': self.role,
+                        'status': self.status,
+                        'ver': self.token_version or 0},
+                       header_fields={'kid': keys.token_key_id})
 
     @staticmethod
     def verify_auth_token(token):
@@ -82,7 +230,22 @@ class User(Base):
         :param token:
         :return mix:
         """
-        s = Serializer(secret_key)
+        claims = User.load_auth_token(token)
+        return claims['uid'] if claims else None
+
+    @staticmethod
+    def load_auth_token(token):
+        """
+        Try to load token, if successful return claims of
+        the token, if false return None
+
+        :param token:
+        :return dict or None:
+        """
+        s = serializers.get(get_key_id(token))
+        if s is None:
+            # Unknown key
+            return None
         try:
             data = s.loads(token)
         except SignatureExpired:
@@ -91,8 +254,9 @@ class User(Base):
         except BadSignature:
             # Invalid Token
             return None
-        uid = data['uid']
-        return uid
+        if not isinstance(data, dict) or 'uid' not in data:
+            return None
+        return data
 
     @property
     def serialize(self):
@@ -130,6 +294,13 @@ class ProductArea(Base):
         }
 
 
+class Version(Base):
+
+    __tablename__ = 'version'
+    name = Column('name', String(20), primary_key=True)
+    value = Column('value', Integer, default=0, nullable=False)
+
+
 class Priority(Base):
 
     __tablename__ = 'priority'
@@ -149,26 +320,42 @@ class Client(Base):
 
         :return integer:
         """
-        amount = len(query(Request.id).filter_by(
-            client=self.id, is_active=True).all())
+        amount = query(func.count(Request.id)).filter_by(
+            client=self.id, is_active=True).scalar()
         return amount + 1
 
-    @property
-    def serialize(self):
+    def serialize_with(self, client_priority):
         """
-        Return client info
+        Return client info with already counted client priority
 
+        :param client_priority: integer
         :return dict:
         """
         return {
             'id': self.id,
             'name': self.name,
-            'client_priority': self.count_requests
+            'client_priority': client_priority
         }
 
+    @property
+    def serialize(self):
+        """
+        Return client info
+
+        :return dict:
+        """
+        return self.serialize_with(self.count_requests)
+
 
 class Request(Base):
     __tablename__ = 'request'
+    __table_args__ = (
+        Index('ix_request_page', 'is_active', 'client_priority', 'id'),
+        Index('ix_request_client_priority', 'client', 'client_priority'),
+        Index('ix_request_product_area', 'product_area'),
+        Index('ix_request_rank_page', 'is_active', 'sort_rank', 'id'),
+        Index('ix_request_rank', 'client', 'is_active', 'sort_rank'),
+    )
     id = Column('id', Integer, primary_key=True)
     title = Column('title', String(80))
     description = Column('description', String(250))
@@ -177,6 +364,9 @@ class Request(Base):
     target_date = Column('target_date', Date)
     product_area = Column('product_area', ForeignKey("product_area.id"))
     is_active = Column('is_active', Boolean, default=True)
+    sort_rank = Column('sort_rank', Integer)
+    client_info = relationship(Client)
+    product_area_info = relationship(ProductArea)
 
     @property
     def get_client(self):
@@ -185,7 +375,7 @@ class Request(Base):
 
         :return:
         """
-        client = query(Client).filter_by(id=self.client).first()
+        client = self.client_info
         return client.serialize if client else None
 
     @property
@@ -195,29 +385,87 @@ class Request(Base):
 
         :return dict:
         """
-        area = query(ProductArea).filter_by(id=self.product_area).first()
-        return area.serialize
+        area = self.product_area_info
+        return area.serialize if area else None
 
-    @property
-    def serialize(self):
+    def serialize_with(self, client, product_area, client_priority=None):
         """
-        Return request info
+        Return request info with already serialized client
+        and product area
 
+        :param client: dict
+        :param product_area: dict
+        :param client_priority: integer, if None the stored one is used
         :return dict:
         """
+        if client_priority is None:
+            client_priority = self.client_priority
+
         return {
             'id': self.id,
             'title': self.title,
             'description': self.description,
-            'client': self.get_client,
-            'client_priority': self.client_priority,
+            'client': client,
+            'client_priority': client_priority,
             'target_date': self.target_date,
-            'product_area': self.get_product_area,
+            'product_area': product_area,
             'is_active': self.is_active
         }
 
+    @property
+    def serialize(self):
+        """
+        Return request info
 
-# create an engine
-if POSTGRES:
-    engine = create_engine(DB_SETTINGS)
+        :return dict:
+        """
+        return self.serialize_with(self.get_client, self.get_product_area)
+
+
+def add_missing_columns(table):
+    """
+    Add columns which were declared after the table was created
+
+    :param table: Table object
+    :return void:
+    """
+    columns = inspect(engine).get_columns(table.name)
+    existing = set(column['name'] for column in columns)
+
+    for column in table.columns:
+        if column.name not in existing:
+            preparer = engine.dialect.identifier_preparer
+            engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                preparer.format_table(table), preparer.format_column(column),
+                column.type.compile(engine.dialect)))
+
+
+def add_missing_indexes(table):
+    """
+    Create indexes which were declared after the table was created.
+    If a unique index can not be created because of duplicated
+    values, skip it and write a warning to the log
+
+    :param table: Table object
+    :return void:
+    """
+    indexes = inspect(engine).get_indexes(table.name)
+    existing = set(index['name'] for index in indexes)
+
+    for index in table.indexes:
+        if index.name not in existing:
+            try:
+                index.create(engine)
+            except IntegrityError:
+                log.warning('Cannot create unique index %s', index.name)
+
+
+# create tables
 Base.metadata.create_all(engine)
+for model in (User, Request):
+    add_missing_columns(model.__table__)
+    add_missing_indexes(model.__table__)
+
+# start hashing processes when the module is complete, and before
+# threads of the server are started
+hash_pool.start()
@@ -4,8 +4,41 @@
 from random import choice
 from string import ascii_uppercase as uppercase, digits
 from datetime import date
+from json import loads
+from io import BytesIO
+from collections import OrderedDict
+from threading import Lock, BoundedSemaphore
+from Queue import Queue, Full
+from multiprocessing import Pool
+from time import time
+from gzip import GzipFile
+from os import walk, path
+from importlib import import_module
+from flask.json import JSONEncoder as FlaskJSONEncoder
+import csv
 import re
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:
+    get_hub = None
+
+
+def is_green():
+    """
+    Check that the app is served by gevent, and threads
+    of the process are patched to greenlets
+
+    :return bool:
+    """
+    return get_hub is not None and is_module_patched('threading')
+
 
 def get_unique_str(amount):
     """
@@ -51,7 +84,11 @@ def convert_date(date_string):
 
     if len(str(match.group())) == 10:
         month, day, year = map(int, date_string.split("/"))
-        return date(year, month, day)
+        try:
+            return date(year, month, day)
+        except ValueError:
+            # impossible date like 13/45/2018
+            return None
     return None
 
 
@@ -77,3 +114,437 @@ def validator(data, inst, length=None):
         return False if len(data) < length else True
 
     return True
+
+
+def make_cursor(client_priority, index):
+    """
+    Return a cursor string for keyset pagination
+    from client priority and id of the last row
+
+    :param client_priority: integer
+    :param index: integer
+    :return string:
+    """
+    return '%s.%s' % (client_priority, index)
+
+
+def parse_cursor(cursor):
+    """
+    Parse a cursor string to tuple (client priority, id),
+    if cursor is invalid return None
+
+    :param cursor: string
+    :return mix:
+    """
+    if not isinstance(cursor, basestring):
+        return None
+
+    values = cursor.split('.')
+    if len(values) != 2:
+        return None
+
+    try:
+        client_priority, index = map(int, values)
+    except ValueError:
+        return None
+
+    return client_priority, index
+
+
+def read_ndjson(lines):
+    """
+    Read rows from lines of newline delimited JSON, every row is
+    a dictionary, or None if the line is not a JSON object.
+    Empty lines are skipped.
+
+    :param lines: iterable of strings
+    :return generator:
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def read_csv(lines):
+    """
+    Read requests from CSV lines with header. Columns are title,
+    description, target_date, client, client_priority and
+    product_area. Every row is converted to the same dictionary
+    as a request from the front-end, or None if it can not be
+    decoded.
+
+    :param lines: iterable of strings
+    :return generator:
+    """
+    for row in csv.DictReader(lines):
+        try:
+            row = dict((key, value.decode('utf-8') if value else value)
+                       for key, value in row.items())
+        except (UnicodeDecodeError, AttributeError):
+            yield None
+            continue
+
+        yield {
+            'title': row.get('title'),
+            'description': row.get('description'),
+            'target_date': row.get('target_date'),
+            'client': {'id': row.get('client'),
+                       'client_priority': row.get('client_priority')},
+            'product_area': {'id': row.get('product_area')}
+        }
+
+
+def to_csv_line(values):
+    """
+    Return one CSV line from list of values, unicode
+    values are encoded to UTF-8
+
+    :param values: list
+    :return string:
+    """
+    buffer = BytesIO()
+    csv.writer(buffer).writerow([
+        value.encode('utf-8') if isinstance(value, unicode) else value
+        for value in values])
+    return buffer.getvalue()
+
+
+def load_json_module(names):
+    """
+    Import the first installed module of names, the module
+    has to provide dumps function like json module
+
+    :param names: list of module names
+    :return module:
+    """
+    for name in names:
+        try:
+            return import_module(name)
+        except ImportError:
+            continue
+    raise ImportError('No JSON module of: %s' % ', '.join(names))
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """
+    Encoder of Flask which encodes with the module set in
+    the attribute module, dates are encoded in ISO format
+    """
+
+    module = None
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return FlaskJSONEncoder.default(self, o)
+
+    def encode(self, o):
+        if self.module is None:
+            return FlaskJSONEncoder.encode(self, o)
+
+        return self.module.dumps(
+            o, default=self.default, indent=self.indent,
+            separators=(self.item_separator, self.key_separator),
+            sort_keys=self.sort_keys, ensure_ascii=self.ensure_ascii)
+
+
+def get_encodings():
+    """
+    Return content encodings the server can compress with,
+    the preferred encoding is first
+
+    :return list:
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_encoding(accept_encodings, encodings):
+    """
+    Return the first of encodings accepted by the client,
+    None if the client accepts none of them
+
+    :param accept_encodings: Accept object of the request
+    :param encodings: list of strings
+    :return string:
+    """
+    for encoding in encodings:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level):
+    """
+    Compress data with gzip or brotli
+
+    :param data: string
+    :param encoding: string, 'gzip' or 'br'
+    :param level: integer, gzip level or brotli quality
+    :return string:
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+
+    stream = BytesIO()
+    with GzipFile(fileobj=stream, mode='wb', compresslevel=level,
+                  mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return stream.getvalue()
+
+
+def compress_files(folder, extensions, levels):
+    """
+    Write compressed variants of files next to them, a variant
+    bigger than its file is not written. Return list of written
+    files.
+
+    :param folder: string, path of the folder
+    :param extensions: list of file extensions
+    :param levels: dictionary, levels of encodings
+    :return list:
+    """
+    suffixes = {'gzip': '.gz', 'br': '.br'}
+    written = list()
+    for root, dirs, files in walk(folder):
+        for name in files:
+            if path.splitext(name)[1] not in extensions:
+                continue
+
+            file_path = path.join(root, name)
+            with open(file_path, 'rb') as source:
+                data = source.read()
+
+            for encoding in get_encodings():
+                compressed = compress(data, encoding, levels[encoding])
+                if len(compressed) < len(data):
+                    with open(file_path + suffixes[encoding], 'wb') as f:
+                        f.write(compressed)
+                    written.append(file_path + suffixes[encoding])
+    return written
+
+
+class Cache(object):
+    """
+    Thread safe in-process cache with a size bound. The least
+    recently used item is dropped when the cache is full, and
+    if ttl is given items expire after ttl seconds.
+    """
+
+    def __init__(self, size, ttl=None):
+        """
+        :param size: integer, max amount of items
+        :param ttl: integer, seconds or None
+        """
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        """
+        Return cached value by key or default
+
+        :param key: hashable
+        :param default: mix
+        :return mix:
+        """
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None:
+                return default
+
+            value, expires = item
+            if expires is not None and expires < time():
+                return default
+
+            # move the item to the end, it is used recently
+            self.items[key] = item
+            return value
+
+    def set(self, key, value):
+        """
+        Save value by key
+
+        :param key: hashable
+        :param value: mix
+        :return void:
+        """
+        expires = time() + self.ttl if self.ttl else None
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = (value, expires)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove value by key
+
+        :param key: hashable
+        :return void:
+        """
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all values
+
+        :return void:
+        """
+        with self.lock:
+            self.items.clear()
+
+
+class EventStream(object):
+    """
+    Publish events to subscribers of this process. Every
+    subscriber reads events from its own bounded queue, a
+    subscriber which does not read fast enough is dropped.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: integer, max amount of events in a queue
+        """
+        self.size = size
+        self.queues = set()
+        self.lock = Lock()
+
+    @property
+    def subscribers(self):
+        """
+        Return amount of subscribers
+
+        :return integer:
+        """
+        return len(self.queues)
+
+    def subscribe(self):
+        """
+        Return a new queue of events
+
+        :return Queue:
+        """
+        queue = Queue(self.size)
+        with self.lock:
+            self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """
+        Stop sending events to the queue
+
+        :param queue: Queue
+        :return void:
+        """
+        with self.lock:
+            self.queues.discard(queue)
+
+    def is_subscribed(self, queue):
+        """
+        Check that events are sent to the queue
+
+        :param queue: Queue
+        :return bool:
+        """
+        return queue in self.queues
+
+    def publish(self, name, data):
+        """
+        Send event to every subscriber
+
+        :param name: string, event name
+        :param data: mix
+        :return void:
+        """
+        with self.lock:
+            queues = list(self.queues)
+
+        for queue in queues:
+            try:
+                queue.put_nowait((name, data))
+            except Full:
+                self.unsubscribe(queue)
+
+
+class PoolBusy(Exception):
+    """
+    Raised when too many tasks are waiting for the worker pool
+    """
+
+
+class WorkerPool(object):
+    """
+    Run CPU heavy functions in a pool of processes, so threads of
+    the web server are not blocked. The amount of waiting tasks is
+    limited, PoolBusy is raised instead of queueing more tasks. If
+    amount of workers is 0 functions run in the calling thread.
+    When the app is served by gevent functions run in the thread
+    pool of the hub, forked processes do not work with patched
+    threads.
+    """
+
+    def __init__(self, workers, limit, timeout):
+        """
+        :param workers: integer, amount of processes
+        :param limit: integer, max amount of running and waiting tasks
+        :param timeout: integer, seconds to wait for a result
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(limit)
+        self.pool = None
+        self.lock = Lock()
+
+    def start(self):
+        """
+        Start processes of the pool. Call it before threads of
+        the server are started, a process forked while another
+        thread holds a lock can hang.
+
+        :return void:
+        """
+        with self.lock:
+            if is_green():
+                get_hub().threadpool.maxsize = self.workers or 1
+            elif self.workers and self.pool is None:
+                self.pool = Pool(self.workers)
+
+    def get_pool(self):
+        """
+        Return the pool of processes, the pool is started by
+        the first task if it was not started
+
+        :return Pool:
+        """
+        self.start()
+        return self.pool
+
+    def run(self, func, *args):
+        """
+        Run function with arguments in the pool and return result,
+        function has to be defined on module level
+
+        :param func: function
+        :param args: arguments of the function
+        :return mix:
+        """
+        if not self.workers:
+            return func(*args)
+
+        if not self.slots.acquire(False):
+            raise PoolBusy()
+
+        try:
+            if is_green():
+                task = get_hub().threadpool.spawn(func, *args)
+                return task.get(timeout=self.timeout)
+            return self.get_pool().apply_async(func, args).get(self.timeout)
+        finally:
+            self.slots.release()
@@ -3,4 +3,12 @@
 
 secret_key = 'Secret_key_for_Flask_App'
 
+# key ring of auth tokens, every worker and node has to use the same
+# keys. To rotate add a new key and change token_key_id, remove the
+# old key when tokens signed by it are expired.
+token_keys = {
+    '1': 'Secret_key_for_auth_tokens'
+}
+token_key_id = '1'
+
 database = ('username', 'password', '0.0.0.0:5432', 'database_name')
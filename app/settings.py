@@ -16,10 +16,101 @@ POSTGRES = False
 
 CONNECT_SETTINGS = 'postgresql://%s:%s@%s/%s' % database
 
+# Read replicas, list of database URLs. Read-only functions of
+# data_provider use a replica, writes go to the primary database.
+REPLICA_SETTINGS = []
+STICKY_SECONDS = 5  # reads go to the primary this long after a write
+
 # SQLite configuration
 DB_FILE_NAME = 'request.db'  # define SQLite database file name
 
 SAME_THREAD = False  # set SQLite for checking same thread
+SQLITE_TIMEOUT = 15  # seconds to wait for a locked database
+SQLITE_JOURNAL_MODE = 'WAL'  # readers do not block on writers
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_CACHE_SIZE = -20000  # negative value is cache size in KiB
+
+# Connection pool
+POOL_SIZE = 5  # connections kept open
+POOL_MAX_OVERFLOW = 10  # connections opened above pool size under load
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+POOL_RECYCLE = 1800  # seconds before a connection is reopened
+POOL_PRE_PING = True  # check connection before use
+
+# Pagination of requests lists
+PAGE_SIZE = 50  # default amount of requests on a page
+MAX_PAGE_SIZE = 500  # the biggest page a client can ask for
+
+# Order requests by sparse rank keys instead of dense client priorities,
+# so moving or inserting a request changes only one row. Run
+# data_provider.renumber_ranks() once after turning it on.
+SPARSE_RANKS = False
+RANK_GAP = 1024  # distance between rank keys of neighbour requests
+
+# Import of requests
+IMPORT_CHUNK_SIZE = 1000  # rows written in one transaction
+IMPORT_MAX_ERRORS = 100  # invalid rows reported in the summary
+EXPORT_CHUNK_SIZE = 1000  # rows fetched from the database at once
+
+# In-process cache of clients and product areas. Every process keeps
+# its own cache, so changes made by other processes are seen after TTL.
+REFERENCE_CACHE_SIZE = 1000
+REFERENCE_CACHE_TTL = 300  # seconds
+
+# In-process cache of authenticated users
+USER_CACHE_SIZE = 1000
+USER_CACHE_TTL = 60  # seconds
+TOKEN_VERSION_TTL = 60  # seconds before revoked tokens fail on other processes
+
+# Successful password verifications kept in memory, so repeated Basic
+# authentication does not run Argon2 every time. Keys are HMAC digests.
+VERIFY_CACHE_SIZE = 1000
+VERIFY_CACHE_TTL = 120  # seconds
+
+# Argon2 parameters, stored hashes with other parameters are
+# hashed again on the next successful login
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 512  # KiB
+ARGON2_PARALLELISM = 2
+ARGON2_HASH_LEN = 16
+ARGON2_SALT_LEN = 16
+
+# Processes which hash and verify passwords, 0 runs Argon2 in the
+# thread of the request
+HASH_WORKERS = 2
+HASH_QUEUE_LIMIT = 32  # running and waiting hashing tasks
+HASH_TIMEOUT = 30  # seconds
+
+# Server-Sent Events of the requests list. Events are sent to the
+# subscribers of the same process.
+STREAM_QUEUE_SIZE = 100  # events kept for a slow subscriber
+STREAM_KEEP_ALIVE = 15  # seconds between keep-alive comments
+STREAM_RETRY = 3000  # milliseconds before the browser reconnects
+
+# JSON of responses is encoded by the first installed module of the
+# list. A module has to provide dumps with the arguments of json.dumps,
+# as simplejson does. Compare modules with bench_json.py, the C
+# speedups of json are the fastest on Python 2.7. Dates are sent in
+# ISO format 'yyyy-mm-dd'.
+JSON_ENCODERS = ['json']
+JSON_SORT_KEYS = False  # json module does not use C speedups to sort keys
+
+# Compression of responses, brotli is used when it is installed
+# and the client accepts it, otherwise gzip
+COMPRESS_MIN_SIZE = 500  # bytes, smaller responses are sent as is
+COMPRESS_LEVEL = 6  # gzip level, 1 - 9
+BROTLI_QUALITY = 5  # brotli quality, 0 - 11
+COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/css',
+                      'text/csv', 'application/javascript']
+# static files compressed by compress_static.py, served when
+# the client accepts the encoding
+STATIC_COMPRESS_EXTENSIONS = ['.css', '.js', '.svg', '.xml', '.webmanifest']
+STATIC_COMPRESS_LEVELS = {'gzip': 9, 'br': 11}  # compressed once, best level
+
+# Asynchronous server, run_async.py serves the app with gevent. Every
+# connection is a greenlet, waiting on the database, HTTP or a stream
+# does not block other connections.
+ASYNC_CONNECTIONS = 1000  # connections served at once
 
 # Test settings
 
@@ -53,6 +53,10 @@
     self.editProductArea = ko.observable('');
     self.requests = ko.observableArray();
     self.completedRequests = ko.observableArray();
+    self.requestsCursor = ko.observable();
+    self.completedCursor = ko.observable();
+    self.pageSize = $('#page-size').data('page-size') || 50;
+    self.loading = false;
     self.requestInfo = ko.observable();
     self.newRequest = ko.observable();
     self.editRequest = ko.observable();
@@ -70,6 +74,11 @@
       var _date;
 
       if (date === undefined) _date = new Date();
+      else if (self.isDate(date)) {
+        // ISO date of the server is a local date, not UTC midnight
+        var parts = date.split('-');
+        _date = new Date(parts[0], parts[1] - 1, parts[2]);
+      }
       else _date = new Date(date);
 
       var day = _date.getDate();
@@ -152,15 +161,15 @@
 
     // TODO: location and requests
     self.location = {
-      uri: function (url) {
-        /** add csrf token as a GET parameter to url */
-        return self.host + url + '?csrf=' + self.getCSRFToken();
+      uri: function (url, query) {
+        /** add csrf token and the query string as GET parameters to url */
+        return self.host + url + '?csrf=' + self.getCSRFToken() + (query || '');
       },
-      get: function (url, callback, err) {
+      get: function (url, callback, err, query) {
         /** prepare and execute a GET request */
         var data = {
           type: 'GET',
-          url: self.location.uri(url),
+          url: self.location.uri(url, query),
           processData: false,
           dataType: 'JSON',
           headers: {"Authorization": self.getCredentials()},
@@ -171,11 +180,11 @@
         };
         $.ajax(data);
       },
-      post: function (url, data, callback, err) {
+      post: function (url, data, callback, err, query) {
         /** prepare and execute a POST request */
         $.ajax({
           type: 'POST',
-          url: self.location.uri(url),
+          url: self.location.uri(url, query),
           processData: false,
           dataType: 'JSON',
           data: ko.toJSON(data),
@@ -312,6 +321,11 @@
       if (self.passwords().p1 && self.passwords().p1 === self.passwords().p2) {
         function successUpdateProfile(res) {
           if (res.error !== undefined) self.message({error: res.error});
+          if (res.token !== undefined) {
+            // the old token was revoked with the password
+            self.token(res.token);
+            delete res.token;
+          }
           if (res) self.user(res);
           location.hash = '#profile'
         }
@@ -370,13 +384,47 @@
     };
 
     // TODO: get requests
+    self.loadPage = function (url, list, cursor, reset) {
+      /**
+       * Uploader for a page of requests. If reset is true replace
+       * the list with the first page, else append the next page
+       */
+      if (self.worker.loading || (!reset && !cursor())) return;
+
+      var query = '&limit=' + self.worker.pageSize;
+      if (!reset) query += '&after=' + cursor();
+
+      self.worker.loading = true;
+      self.worker.location.get(url,
+        function (res) {
+          self.worker.loading = false;
+          if (res.error !== undefined) {
+            self.worker.message({error: res.error});
+            return;
+          }
+          if (reset) list(res.requests);
+          else {
+            // rows moved behind the cursor by changes come again
+            var ids = res.requests.map(function (request) {
+              return request.id;
+            });
+            list(list().filter(function (request) {
+              return ids.indexOf(request.id) < 0;
+            }).concat(res.requests));
+          }
+          list.loaded = true;
+          cursor(res.next);
+        }, function (msg) {
+          self.worker.loading = false;
+          self.err(msg);
+        }, query);
+    };
+
     self.getRequests = function () {
       /** Uploader for list of requests */
       if (!self.worker.requests() || self.worker.requests().length === 0) {
-        self.worker.location.get('/requests',
-          function (res) {
-            self.worker.requests(res);
-          }, self.err);
+        self.loadPage('/requests', self.worker.requests,
+          self.worker.requestsCursor, true);
       }
     };
 
@@ -384,27 +432,180 @@
       /** Uploader for completed requests */
       if (!self.worker.completedRequests() ||
         self.worker.completedRequests().length === 0) {
-        self.worker.location.get('/requests/get/completed',
-          function (res) {
-            self.worker.completedRequests(res);
-          }, self.err);
+        self.updateCompletedRequests();
       }
     };
 
     self.updateCompletedRequests = function () {
       /** Update completed requests list */
-      self.worker.location.get('/requests/get/completed',
-        function (res) {
-          self.worker.completedRequests(res);
-        }, self.err);
+      self.loadPage('/requests/get/completed', self.worker.completedRequests,
+        self.worker.completedCursor, true);
+    };
+
+    self.onScroll = function () {
+      /** Upload next page of the displayed list near the bottom of page */
+      var bottom = $(window).scrollTop() + $(window).height();
+      if (bottom < $(document).height() - 200) return;
+      if (self.routeName() !== 'requests') return;
+
+      if (self.actionName() === 'completed') {
+        self.loadPage('/requests/get/completed', self.worker.completedRequests,
+          self.worker.completedCursor, false);
+      } else if (!self.actionName()) {
+        self.loadPage('/requests', self.worker.requests,
+          self.worker.requestsCursor, false);
+      }
+    };
+
+    // TODO: apply delta responses
+    self.patchList = function (list, items, removed) {
+      /**
+       * Replace changed items by id, append new items and drop
+       * removed ids of the list, return the new array. A list
+       * which was not loaded yet is returned as it is, it gets
+       * all items when it is loaded.
+       */
+      if (!list.loaded) return list();
+
+      var changed = {};
+      items.forEach(function (item) {
+        changed[item.id] = item;
+      });
+      var result = list().filter(function (item) {
+        return removed.indexOf(item.id) < 0;
+      }).map(function (item) {
+        var current = changed[item.id] || item;
+        delete changed[item.id];
+        return current;
+      });
+      for (var id in changed) {
+        if (changed.hasOwnProperty(id)) result.push(changed[id]);
+      }
+      return result;
+    };
+
+    self.applyRequestsDelta = function (res) {
+      /** Apply changed and removed requests to active and completed lists */
+      var clients = {};
+      res.clients.forEach(function (client) {
+        clients[client.id] = client;
+      });
+
+      function update(list, cursor, isActive) {
+        var items = [];
+        var removed = res.removed.slice();
+        res.requests.forEach(function (request) {
+          if (request.is_active === isActive &&
+            self.beforeCursor(request, cursor())) items.push(request);
+          else removed.push(request.id);
+        });
+        var result = self.patchList(list, items, removed);
+        result.forEach(function (request) {
+          if (clients[request.client.id]) {
+            request.client = clients[request.client.id];
+          }
+        });
+        list(result.sort(self.byPriority));
+      }
+
+      update(self.worker.requests, self.worker.requestsCursor, true);
+      update(self.worker.completedRequests, self.worker.completedCursor,
+        false);
+      self.worker.clients(self.patchList(self.worker.clients, res.clients, []));
     };
 
+    self.byPriority = function (a, b) {
+      /** Compare requests by client priority and id */
+      return a.client_priority - b.client_priority || a.id - b.id;
+    };
+
+    self.beforeCursor = function (request, cursor) {
+      /**
+       * Check that request sorts at or before the cursor of the
+       * loaded pages, requests after it come with the next page
+       */
+      if (!cursor) return true;
+      var last = cursor.split('.');
+      return self.byPriority(request,
+        {client_priority: Number(last[0]), id: Number(last[1])}) <= 0;
+    };
+
+    self.applyShift = function (res) {
+      /** Apply shifted client priorities, res.requests is [[id, priority]] */
+      var priorities = {};
+      res.requests.forEach(function (pair) {
+        priorities[pair[0]] = pair[1];
+      });
+
+      [[self.worker.requests, self.worker.requestsCursor],
+        [self.worker.completedRequests, self.worker.completedCursor]].forEach(
+        function (pair) {
+          var result = pair[0]().map(function (request) {
+            if (priorities[request.id] === undefined) return request;
+            return $.extend({}, request,
+              {client_priority: priorities[request.id]});
+          }).filter(function (request) {
+            return self.beforeCursor(request, pair[1]());
+          });
+          pair[0](result.sort(self.byPriority));
+        });
+    };
+
+    // TODO: change feed of requests
+    self.stream = null;
+
+    self.reloadRequests = function () {
+      /** Load lists of requests again */
+      self.loadPage('/requests', self.worker.requests,
+        self.worker.requestsCursor, true);
+      if (self.worker.completedRequests.loaded) {
+        self.updateCompletedRequests();
+      }
+    };
+
+    self.openStream = function () {
+      /** Listen changes of requests made by other users */
+      if (self.stream || !window.EventSource) return;
+
+      var opened = false;
+      self.stream = new EventSource(
+        self.worker.location.uri('/requests/stream'));
+      self.stream.onopen = function () {
+        // events could be lost while the stream was reconnected
+        if (opened) self.reloadRequests();
+        opened = true;
+      };
+      ['create', 'update', 'complete', 'delete'].forEach(function (name) {
+        self.stream.addEventListener(name, function (e) {
+          self.applyRequestsDelta(JSON.parse(e.data));
+        });
+      });
+      self.stream.addEventListener('shift', function (e) {
+        self.applyShift(JSON.parse(e.data));
+      });
+      self.stream.addEventListener('reset', self.reloadRequests);
+    };
+
+    self.closeStream = function () {
+      /** Stop listening changes of requests */
+      if (self.stream) {
+        self.stream.close();
+        self.stream = null;
+      }
+    };
+
+    self.worker.login.subscribe(function (login) {
+      if (login) self.openStream();
+      else self.closeStream();
+    });
+
     // TODO: get clients
     self.getClients = function () {
       /** Uploader for clients list */
       if (!self.worker.clients() || self.worker.clients().length === 0) {
         self.worker.location.get('/clients',
           function (res) {
+            self.worker.clients.loaded = true;
             self.worker.clients(res);
           }, self.err);
       }
@@ -418,9 +619,13 @@
         // send query to back-end
         self.worker.location.post('/clients/new', {name: self.worker.newClient()},
           function (res) {
-            self.worker.clients(res);
-            self.worker.newClient('');
-          }, self.err)
+            if (res.error !== undefined) self.worker.message({error: res.error});
+            else {
+              self.worker.clients(self.patchList(self.worker.clients,
+                res.clients, res.removed));
+              self.worker.newClient('');
+            }
+          }, self.err, '&delta=1')
       }
       else self.worker.message({error: 'Client name too short'});
     };
@@ -432,8 +637,10 @@
       } else {
         self.worker.location.post('/clients/edit', self.worker.editClient(),
           function (res) {
-            self.worker.clients(res);
-          }, self.err)
+            if (res.error !== undefined) self.worker.message({error: res.error});
+            else self.worker.clients(self.patchList(self.worker.clients,
+              res.clients, res.removed));
+          }, self.err, '&delta=1')
       }
     };
 
@@ -442,8 +649,9 @@
       self.worker.location.post('/clients/delete', client,
         function (res) {
           if (res.error !== undefined) self.worker.message({error: res.error});
-          else self.worker.clients(res);
-        }, self.err);
+          else self.worker.clients(self.patchList(self.worker.clients,
+            res.clients, res.removed));
+        }, self.err, '&delta=1');
     };
 
     // TODO: get product areas
@@ -452,6 +660,7 @@
       if (!self.worker.areas() || self.worker.areas().length === 0) {
         self.worker.location.get('/areas',
           function (res) {
+            self.worker.areas.loaded = true;
             self.worker.areas(res);
           }, self.err);
       }
@@ -463,9 +672,13 @@
       if (self.worker.newProductArea().length > 3) {
         self.worker.location.post('/areas/new', {name: self.worker.newProductArea()},
           function (res) {
-            self.worker.areas(res);
-            self.worker.newProductArea('');
-          }, self.err)
+            if (res.error !== undefined) self.worker.message({error: res.error});
+            else {
+              self.worker.areas(self.patchList(self.worker.areas,
+                res.areas, res.removed));
+              self.worker.newProductArea('');
+            }
+          }, self.err, '&delta=1')
       }
     };
 
@@ -477,9 +690,10 @@
         self.worker.location.post('/areas/edit', self.worker.editProductArea(),
           function (res) {
             if (res.error === undefined) {
-              self.worker.areas(res);
+              self.worker.areas(self.patchList(self.worker.areas,
+                res.areas, res.removed));
             } else self.worker.message({error: res.error});
-          }, self.err);
+          }, self.err, '&delta=1');
       }
     };
 
@@ -488,8 +702,9 @@
       self.worker.location.post('/areas/delete', area,
         function (res) {
           if (res.error !== undefined) self.worker.message({error: res.error});
-          else self.worker.areas(res);
-        }, self.err);
+          else self.worker.areas(self.patchList(self.worker.areas,
+            res.areas, res.removed));
+        }, self.err, '&delta=1');
     };
 
     // TODO: route functions
@@ -608,10 +823,9 @@
       var data = {id: self.worker.removeRequest()['id']};
       self.worker.location.post('/requests/delete', data, function (res) {
         if (res.error === undefined) {
-          self.worker.requests(res);
-          self.updateCompletedRequests();
+          self.applyRequestsDelta(res);
         } else self.worker.message({error: res.error});
-      });
+      }, self.err, '&delta=1');
     };
 
     self.markRequest = function () {
@@ -619,10 +833,9 @@
       var data = {id: self.worker.markRequest()['id']};
       self.worker.location.post('/requests/complete', data, function (res) {
         if (res.error === undefined) {
-          self.worker.requests(res);
-          self.updateCompletedRequests();
+          self.applyRequestsDelta(res);
         } else self.worker.message({error: res.error});
-      }, self.err)
+      }, self.err, '&delta=1')
     };
 
     self.goTo = function (route) {
@@ -695,13 +908,12 @@
           function (res) {
             if (res.error) self.worker.message({error: res.error});
             else {
-              self.getClients();
+              self.applyRequestsDelta(res);
               self.worker.initRequest();
-              self.worker.requests(res);
               self.worker.chosenClient(null);
               location.hash = '#profile/requests';
             }
-          });
+          }, self.err, '&delta=1');
       }
     };
 
@@ -805,11 +1017,11 @@
               self.worker.message({error: res.error});
             }
             else {
-              self.worker.requests(res);
+              self.applyRequestsDelta(res);
               self.worker.message({info: "Request was updated"});
               location.hash = '#profile/requests';
             }
-          }, self.err)
+          }, self.err, '&delta=1')
       }
     };
 
@@ -828,6 +1040,7 @@
     /**
      * When page is loaded display content and run tooltip method
      */
+    $(window).scroll(viewModel.onScroll);
     $('#body').removeClass('hide');
     if ('ontouchstart' in document.documentElement) {
       // Block tooltip event on touch devices
@@ -837,5 +1050,6 @@
     }
   });
 
-  ko.applyBindings(new ViewModel());
+  var viewModel = new ViewModel();
+  ko.applyBindings(viewModel);
 }());
@@ -1 +1,23 @@
-(function(){(function(d,s,id){var js,fjs=d.getElementsByTagName(s)[0];if(d.getElementById(id)){return}js=d.createElement(s);js.id=id;js.src="https://apis.google.com/js/client.js?onload=onLoadedGoogle";js.async=true;fjs.parentNode.insertBefore(js,fjs)}(document,'script','google-sign-in-script'));function onLoadedGoogle(){gapi.client.setApiKey(document.getElementById('google-app-id').getAttribute('data-key-api'));gapi.client.load('plus','v1',function(){})}var Worker=function(){var self=this;self.host="";self.menu=['about','license'];self.requestMenu=['user','requests'];self.login=ko.observable(false);self.user=ko.observable();self.message=ko.observable();self.data=ko.observable();self.token=ko.observable(null);self.passwords=ko.observable({p1:null,p2:null});self.credentials=ko.observable({email:null,password:null});self.clients=ko.observableArray();self.newClient=ko.observable('');self.editClient=ko.observable('');self.chosenClient=ko.observable();self.areas=ko.observableArray();self.newProductArea=ko.observable('');self.editProductArea=ko.observable('');self.requests=ko.observableArray();self.completedRequests=ko.observableArray();self.requestInfo=ko.observable();self.newRequest=ko.observable();self.editRequest=ko.observable();self.markRequest=ko.observable();self.removeRequest=ko.observable();self.selectedClient=ko.observable();self.selectedProductArea=ko.observable();self.getDate=function(date){var _date;if(date===undefined)_date=new Date();else _date=new Date(date);var day=_date.getDate();var month=_date.getMonth()+1;var year=_date.getFullYear();if(day<10)day='0'+day;if(month<10)month='0'+month;_date=year+'-'+month+'-'+day;$('#target_date').data(_date);return _date};self.isDate=function(date){var dateArr=date.match(/\d{4}-\d{2}-\d{2}/);return Boolean(dateArr)&&dateArr.length>0};self.initRequest=function(){self.newRequest({title:null,description:null,client:self.chosenClient(),target_date:self.getDate(),product_area:null});location.hash='#profile/requests'};self.err=function(msg){if(msg.status&&msg.responseText.length<100){self.message({error:msg.responseText})}else{$('#body').html(msg.responseText)}};self.closeModals=function(){$('#modalLogin').modal('hide');$('#modalRegister').modal('hide')};self.getCredentials=function(){if(self.token())return"Basic "+btoa(self.token()+":");else if(self.credentials().email&&self.credentials().password){var credentials=self.credentials();return"Basic "+btoa(credentials.email+":"+credentials.password)}else return""};self.updateToken=function(){self.location.post('/token',null,function(res){if(res.user!==undefined&&res.token!==undefined){self.user(res.user);self.token(res.token)}else{self.message({error:'Server is not available.'})}},self.err)};self.location={uri:function(url){return self.host+url+'?csrf='+self.getCSRFToken()},get:function(url,callback,err){var data={type:'GET',url:self.location.uri(url),processData:false,dataType:'JSON',headers:{"Authorization":self.getCredentials()},contentType:'application/json; charset=utf-8',statusCode:{401:self.updateToken},success:callback,error:err};$.ajax(data)},post:function(url,data,callback,err){$.ajax({type:'POST',url:self.location.uri(url),processData:false,dataType:'JSON',data:ko.toJSON(data),headers:{"Authorization":self.getCredentials()},contentType:'application/json; charset=utf-8',statusCode:{401:self.updateToken},success:callback,error:err})}};self.getCSRFToken=function(){return $('#csrf-token').data('csrf-token')};self.GoogleLogin=function(){var googleMeta=document.getElementById('google-app-id');var googleCallBack=function(result){if(result['code']){function successLogin(res){if(res){self.user(res.user);self.token(res.token);self.closeModals();location.hash='#profile'}else if(res.error){self.message({error:res.error});console.log(res.error)}}self.location.post('/oauth/google',{code:result['code']},successLogin,self.err)}};self.googleParams={'clientid':googleMeta.getAttribute('data-clientid'),'cookiepolicy':googleMeta.getAttribute('data-cookiepolicy'),'redirecturi':googleMeta.getAttribute('data-redirecturi'),'accesstype':googleMeta.getAttribute('data-accesstype'),'approvalprompt':googleMeta.getAttribute('data-approvalprompt'),'scope':googleMeta.getAttribute('data-scope'),'callback':googleCallBack};gapi.auth.signIn(self.googleParams)};self.userValid=function(){return self.user().email&&self.user().first_name&&self.user().last_name};self.passwordsValid=function(){return self.passwords().p1&&self.passwords().p2&&self.passwords().p1===self.passwords().p2};self.onLogin=function(){self.closeModals();if(self.credentials().email&&self.credentials().password){function successLogin(res){if(res.user!==undefined&&res.token!==undefined){self.user(res.user);self.token(res.token);location.hash='#profile'}else{self.message({error:'Server is not available.'})}}self.location.post('/token',null,successLogin,self.err)}else{self.message({error:'Email or password can\'t to be empty'})}};self.onRegister=function(){self.closeModals();if(!self.userValid()){self.message({error:'Fields can not to be empty',info:null})}else if(!self.passwordsValid()){self.message({error:'Passwords does not match'})}else{function successRegister(res){if(res.error!==undefined)self.message({error:res.error});if(res.user){self.user(res.user);self.token(res.token);location.hash='#profile'}else{self.message({error:'server is not available'})}}var postData={email:self.user().email,first_name:self.user().first_name,last_name:self.user().last_name,password:self.passwords().p1};self.location.post('/registration',postData,successRegister,self.err)}};self.onUpdateProfile=function(){if(self.passwords().p1&&self.passwords().p1===self.passwords().p2){function successUpdateProfile(res){if(res.error!==undefined)self.message({error:res.error});if(res)self.user(res);location.hash='#profile'}self.location.post('/profile/update',{user:self.user(),password:self.passwords().p1},successUpdateProfile,self.err)}else{self.message({error:'Passwords do not match'})}};self.removeProfile=function(){function successRemove(res){self.message({info:res.info});self.onLogout();location.hash=''}self.location.post('/profile/remove',null,successRemove,self.err)};self.onLogout=function(){self.user(null);self.token(null);self.login(false)}};var ViewModel=function(){var self=this;self.worker=new Worker();self.routeName=ko.observable(null);self.actionName=ko.observable(null);self.data=self.worker.data;self.checkAuth=function(){if(self.data().name==='profile'&&!self.worker.user()){self.worker.onLogout();location.hash=''}else if(self.worker.user())self.worker.login(true)};self.getRequests=function(){if(!self.worker.requests()||self.worker.requests().length===0){self.worker.location.get('/requests',function(res){self.worker.requests(res)},self.err)}};self.getCompletedRequests=function(){if(!self.worker.completedRequests()||self.worker.completedRequests().length===0){self.worker.location.get('/requests/get/completed',function(res){self.worker.completedRequests(res)},self.err)}};self.updateCompletedRequests=function(){self.worker.location.get('/requests/get/completed',function(res){self.worker.completedRequests(res)},self.err)};self.getClients=function(){if(!self.worker.clients()||self.worker.clients().length===0){self.worker.location.get('/clients',function(res){self.worker.clients(res)},self.err)}};self.addClient=function(){if(self.worker.newClient().length>3){self.worker.location.post('/clients/new',{name:self.worker.newClient()},function(res){self.worker.clients(res);self.worker.newClient('')},self.err)}else self.worker.message({error:'Client name too short'})};self.updateClient=function(){if(self.worker.editClient().name<3){self.worker.message({error:'Client name too short'})}else{self.worker.location.post('/clients/edit',self.worker.editClient(),function(res){self.worker.clients(res)},self.err)}};self.removeClient=function(client){self.worker.location.post('/clients/delete',client,function(res){if(res.error!==undefined)self.worker.message({error:res.error});else self.worker.clients(res)},self.err)};self.getAreas=function(){if(!self.worker.areas()||self.worker.areas().length===0){self.worker.location.get('/areas',function(res){self.worker.areas(res)},self.err)}};self.addProductArea=function(){if(self.worker.newProductArea().length>3){self.worker.location.post('/areas/new',{name:self.worker.newProductArea()},function(res){self.worker.areas(res);self.worker.newProductArea('')},self.err)}};self.updateProductArea=function(){if(self.worker.editProductArea().name<3){self.worker.message({error:'Product area too short'})}else{self.worker.location.post('/areas/edit',self.worker.editProductArea(),function(res){if(res.error===undefined){self.worker.areas(res)}else self.worker.message({error:res.error})},self.err)}};self.removeProductArea=function(area){self.worker.location.post('/areas/delete',area,function(res){if(res.error!==undefined)self.worker.message({error:res.error});else self.worker.areas(res)},self.err)};self.onProfilePath=function(){self.routeName(null);self.data({name:'profile'});self.actionName(null);self.checkAuth();self.getRequests();self.getCompletedRequests();self.getClients();self.getAreas();self.tooltip()};self.onAboutPath=function(){self.routeName(null);self.data({name:'about'});self.actionName(null)};self.onLicensePath=function(){self.routeName(null);self.data({name:'license'});self.actionName(null)};self.onRoute=function(){self.routeName(this.params.route);self.data({name:'profile'});self.actionName(null);self.checkAuth();self.tooltip()};self.onAction=function(){self.routeName(this.params.route);self.data({name:'profile'});self.actionName(this.params.action);self.checkAuth();self.tooltip()};self.router=new Sammy(function(){this.get('#profile',self.onProfilePath);this.get('#about',self.onAboutPath);this.get('#license',self.onLicensePath);this.get('#profile/:route',self.onRoute);this.get('#profile/:route/:action',self.onAction);this.get('',function(){this.app.runRoute('get','#about')})}).run();self.closeAlert=function(){self.worker.message({error:null,info:null})};self.err=self.worker.err;self.modalLogin=function(){$('#modalLogin').modal()};self.modalRegister=function(){self.worker.user({email:null,first_name:null,last_name:null});$('#modalRegister').modal()};self.modalNewClient=function(){$('#newClientModal').modal()};self.modalNewProductArea=function(){$('#modalNewProductArea').modal()};self.editClient=function(elem){self.worker.editClient(elem);$('#editClientModal').modal()};self.editProductArea=function(area){self.worker.editProductArea(area);$('#modalEditProductArea').modal()};self.markAsCompletedModal=function(request){self.worker.markRequest(request);$('#modalMarkAsComplete').modal()};self.removeRequestModal=function(request){self.worker.removeRequest(request);$('#modalRemoveRequest').modal()};self.removeRequest=function(){var data={id:self.worker.removeRequest()['id']};self.worker.location.post('/requests/delete',data,function(res){if(res.error===undefined){self.worker.requests(res);self.updateCompletedRequests()}else self.worker.message({error:res.error})})};self.markRequest=function(){var data={id:self.worker.markRequest()['id']};self.worker.location.post('/requests/complete',data,function(res){if(res.error===undefined){self.worker.requests(res);self.updateCompletedRequests()}else self.worker.message({error:res.error})},self.err)};self.goTo=function(route){location.hash='#profile/'+route};self.openLink=function(path){return function(){self.tooltip();location.hash='#profile'+path}};self.goToAction=function(path){return function(){location.hash='#profile/'+path}};self.addRequest=function(){var request=self.worker.newRequest();if(request.title.length<3){self.worker.message({error:"Title too short"})}if(request.description.length<10){self.worker.message({error:"Description too short"})}var client=self.worker.chosenClient();if(client&&!client.client_priority){self.worker.message({error:"Client priority can't be empty"})}if(client&&Number(client.client_priority)<1){self.worker.message({error:"Client priority can't be 0"})}if(!request.target_date){self.worker.message({error:"Set up target date"})}if(self.worker.isDate(request.target_date)){var oldDate=request.target_date;var dateArray=oldDate.split("-");var newDate=dateArray[1]+'/'+dateArray[2]+'/'+dateArray[0];self.worker.newRequest({title:request.title,description:request.description,client:self.worker.chosenClient(),target_date:newDate,product_area:request.product_area})}else self.worker.message({error:"The date has the wrong format"});var msg=self.worker.message();if(msg===undefined||msg.error===undefined){self.worker.location.post('/requests/new',self.worker.newRequest(),function(res){if(res.error)self.worker.message({error:res.error});else{self.getClients();self.worker.initRequest();self.worker.requests(res);self.worker.chosenClient(null);location.hash='#profile/requests'}})}};self.openRequest=function(request){self.worker.requestInfo(request);location.hash='#profile/requests/info'};self.editRequest=function(request){var date=self.worker.getDate(request.target_date);self.worker.editClient(request.client);self.worker.selectedProductArea(request.product_area);self.worker.editRequest({id:request.id,title:request.title,description:request.description,client:self.worker.editClient(),target_date:date,client_priority:request.client_priority,product_area:request.product_area});$('#edit_client').change(function(){var client=self.worker.editRequest().client;if(client!==undefined){self.worker.editClient(client);$('#edit_client_priority').val(client.client_priority)}});$('#edit_product_area').change(function(){var request=self.worker.editRequest();if(request!==undefined){self.worker.selectedProductArea(request.product_area)}});$('#edit_client_priority').change(function(){var client=self.worker.editClient();client.client_priority=self.worker.editRequest().client_priority;self.worker.editClient(client)});location.hash='#profile/requests/edit'};self.updateRequest=function(){var data;var date;var request=self.worker.editRequest();if(request.client!==undefined)self.worker.editClient(request.client);if(request.product_area!==undefined){self.worker.selectedProductArea(request.product_area)}if(self.worker.isDate(request.target_date)){var oldDate=request.target_date;var dateArray=oldDate.split("-");date=dateArray[1]+'/'+dateArray[2]+'/'+dateArray[0]}else self.worker.message({error:"The date has the wrong format"});if(request.title.length<3)self.worker.message({error:"Title is too short"});if(request.description.length<3)self.worker.message({error:"Description is too short"});if(request.target_date===undefined)self.worker.message({error:"Must have a date"});if(Number(self.worker.editClient().client_priority)<1)self.worker.message({error:"Must have a priority"});var msg=self.worker.message();if(msg===undefined||msg.error===undefined){data={id:request.id,title:request.title,description:request.description,client:self.worker.editClient(),target_date:date,product_area:self.worker.selectedProductArea()};request.client_priority=self.worker.editClient().client_priority;request.client=self.worker.editClient();request.product_area=self.worker.selectedProductArea();self.worker.editRequest(request);self.worker.location.post('/requests/edit',data,function(res){if(res.error){self.worker.message({error:res.error})}else{self.worker.requests(res);self.worker.message({info:"Request was updated"});location.hash='#profile/requests'}},self.err)}};self.tooltip=function(){if('ontouchstart'in document.documentElement){return null}else{$('.tltip').tooltip()}}};$(document).ready(function(){$('#body').removeClass('hide');if('ontouchstart'in document.documentElement){return null}else{$('.tltip').tooltip()}});ko.applyBindings(new ViewModel())}());
\ No newline at end of file
+(function(){(function(d,s,id){var js,fjs=d.getElementsByTagName(s)[0];if(d.getElementById(id)){return;}
+js=d.createElement(s);js.id=id;js.src="https://apis.google.com/js/client.js?onload=onLoadedGoogle";js.async=true;fjs.parentNode.insertBefore(js,fjs);}(document,'script','google-sign-in-script'));function onLoadedGoogle(){gapi.client.setApiKey(document.getElementById('google-app-id').getAttribute('data-key-api'));gapi.client.load('plus','v1',function(){});}
+var Worker=function(){var self=this;self.host="";self.menu=['about','license'];self.requestMenu=['user','requests'];self.login=ko.observable(false);self.user=ko.observable();self.message=ko.observable();self.data=ko.observable();self.token=ko.observable(null);self.passwords=ko.observable({p1:null,p2:null});self.credentials=ko.observable({email:null,password:null});self.clients=ko.observableArray();self.newClient=ko.observable('');self.editClient=ko.observable('');self.chosenClient=ko.observable();self.areas=ko.observableArray();self.newProductArea=ko.observable('');self.editProductArea=ko.observable('');self.requests=ko.observableArray();self.completedRequests=ko.observableArray();self.requestsCursor=ko.observable();self.completedCursor=ko.observable();self.pageSize=$('#page-size').data('page-size')||50;self.loading=false;self.requestInfo=ko.observable();self.newRequest=ko.observable();self.editRequest=ko.observable();self.markRequest=ko.observable();self.removeRequest=ko.observable();self.selectedClient=ko.observable();self.selectedProductArea=ko.observable();self.getDate=function(date){var _date;if(date===undefined)_date=new Date();else if(self.isDate(date)){var parts=date.split('-');_date=new Date(parts[0],parts[1]-1,parts[2]);}
+else _date=new Date(date);var day=_date.getDate();var month=_date.getMonth()+1;var year=_date.getFullYear();if(day<10)day='0'+day;if(month<10)month='0'+month;_date=year+'-'+month+'-'+day;$('#target_date').data(_date);return _date;};self.isDate=function(date){var dateArr=date.match(/\d{4}-\d{2}-\d{2}/);return Boolean(dateArr)&&dateArr.length>0;};self.initRequest=function(){self.newRequest({title:null,description:null,client:self.chosenClient(),target_date:self.getDate(),product_area:null});location.hash='#profile/requests';};self.err=function(msg){if(msg.status&&msg.responseText.length<100){self.message({error:msg.responseText});}
+else{$('#body').html(msg.responseText);}};self.closeModals=function(){$('#modalLogin').modal('hide');$('#modalRegister').modal('hide');};self.getCredentials=function(){if(self.token())return"Basic "+btoa(self.token()+":");else if(self.credentials().email&&self.credentials().password){var credentials=self.credentials();return"Basic "+btoa(credentials.email+":"+credentials.password);}else return"";};self.updateToken=function(){self.location.post('/token',null,function(res){if(res.user!==undefined&&res.token!==undefined){self.user(res.user);self.token(res.token);}else{self.message({error:'Server is not available.'})}},self.err);};self.location={uri:function(url,query){return self.host+url+'?csrf='+self.getCSRFToken()+(query||'');},get:function(url,callback,err,query){var data={type:'GET',url:self.location.uri(url,query),processData:false,dataType:'JSON',headers:{"Authorization":self.getCredentials()},contentType:'application/json; charset=utf-8',statusCode:{401:self.updateToken},success:callback,error:err};$.ajax(data);},post:function(url,data,callback,err,query){$.ajax({type:'POST',url:self.location.uri(url,query),processData:false,dataType:'JSON',data:ko.toJSON(data),headers:{"Authorization":self.getCredentials()},contentType:'application/json; charset=utf-8',statusCode:{401:self.updateToken},success:callback,error:err});}};self.getCSRFToken=function(){return $('#csrf-token').data('csrf-token');};self.GoogleLogin=function(){var googleMeta=document.getElementById('google-app-id');var googleCallBack=function(result){if(result['code']){function successLogin(res){if(res){self.user(res.user);self.token(res.token);self.closeModals();location.hash='#profile';}else if(res.error){self.message({error:res.error});console.log(res.error);}}
+self.location.post('/oauth/google',{code:result['code']},successLogin,self.err)}};self.googleParams={'clientid':googleMeta.getAttribute('data-clientid'),'cookiepolicy':googleMeta.getAttribute('data-cookiepolicy'),'redirecturi':googleMeta.getAttribute('data-redirecturi'),'accesstype':googleMeta.getAttribute('data-accesstype'),'approvalprompt':googleMeta.getAttribute('data-approvalprompt'),'scope':googleMeta.getAttribute('data-scope'),'callback':googleCallBack};gapi.auth.signIn(self.googleParams);};self.userValid=function(){return self.user().email&&self.user().first_name&&self.user().last_name};self.passwordsValid=function(){return self.passwords().p1&&self.passwords().p2&&self.passwords().p1===self.passwords().p2;};self.onLogin=function(){self.closeModals();if(self.credentials().email&&self.credentials().password){function successLogin(res){if(res.user!==undefined&&res.token!==undefined){self.user(res.user);self.token(res.token);location.hash='#profile';}else{self.message({error:'Server is not available.'})}}
+self.location.post('/token',null,successLogin,self.err);}else{self.message({error:'Email or password can\'t to be empty'});}};self.onRegister=function(){self.closeModals();if(!self.userValid()){self.message({error:'Fields can not to be empty',info:null});}else if(!self.passwordsValid()){self.message({error:'Passwords does not match'});}else{function successRegister(res){if(res.error!==undefined)self.message({error:res.error});if(res.user){self.user(res.user);self.token(res.token);location.hash='#profile';}else{self.message({error:'server is not available'});}}
+var postData={email:self.user().email,first_name:self.user().first_name,last_name:self.user().last_name,password:self.passwords().p1};self.location.post('/registration',postData,successRegister,self.err);}};self.onUpdateProfile=function(){if(self.passwords().p1&&self.passwords().p1===self.passwords().p2){function successUpdateProfile(res){if(res.error!==undefined)self.message({error:res.error});if(res.token!==undefined){self.token(res.token);delete res.token;}
+if(res)self.user(res);location.hash='#profile'}
+self.location.post('/profile/update',{user:self.user(),password:self.passwords().p1},successUpdateProfile,self.err);}else{self.message({error:'Passwords do not match'})}};self.removeProfile=function(){function successRemove(res){self.message({info:res.info});self.onLogout();location.hash='';}
+self.location.post('/profile/remove',null,successRemove,self.err);};self.onLogout=function(){self.user(null);self.token(null);self.login(false);};};var ViewModel=function(){var self=this;self.worker=new Worker();self.routeName=ko.observable(null);self.actionName=ko.observable(null);self.data=self.worker.data;self.checkAuth=function(){if(self.data().name==='profile'&&!self.worker.user()){self.worker.onLogout();location.hash='';}else if(self.worker.user())self.worker.login(true);};self.loadPage=function(url,list,cursor,reset){if(self.worker.loading||(!reset&&!cursor()))return;var query='&limit='+self.worker.pageSize;if(!reset)query+='&after='+cursor();self.worker.loading=true;self.worker.location.get(url,function(res){self.worker.loading=false;if(res.error!==undefined){self.worker.message({error:res.error});return;}
+if(reset)list(res.requests);else{var ids=res.requests.map(function(request){return request.id;});list(list().filter(function(request){return ids.indexOf(request.id)<0;}).concat(res.requests));}
+list.loaded=true;cursor(res.next);},function(msg){self.worker.loading=false;self.err(msg);},query);};self.getRequests=function(){if(!self.worker.requests()||self.worker.requests().length===0){self.loadPage('/requests',self.worker.requests,self.worker.requestsCursor,true);}};self.getCompletedRequests=function(){if(!self.worker.completedRequests()||self.worker.completedRequests().length===0){self.updateCompletedRequests();}};self.updateCompletedRequests=function(){self.loadPage('/requests/get/completed',self.worker.completedRequests,self.worker.completedCursor,true);};self.onScroll=function(){var bottom=$(window).scrollTop()+$(window).height();if(bottom<$(document).height()-200)return;if(self.routeName()!=='requests')return;if(self.actionName()==='completed'){self.loadPage('/requests/get/completed',self.worker.completedRequests,self.worker.completedCursor,false);}else if(!self.actionName()){self.loadPage('/requests',self.worker.requests,self.worker.requestsCursor,false);}};self.patchList=function(list,items,removed){if(!list.loaded)return list();var changed={};items.forEach(function(item){changed[item.id]=item;});var result=list().filter(function(item){return removed.indexOf(item.id)<0;}).map(function(item){var current=changed[item.id]||item;delete changed[item.id];return current;});for(var id in changed){if(changed.hasOwnProperty(id))result.push(changed[id]);}
+return result;};self.applyRequestsDelta=function(res){var clients={};res.clients.forEach(function(client){clients[client.id]=client;});function update(list,cursor,isActive){var items=[];var removed=res.removed.slice();res.requests.forEach(function(request){if(request.is_active===isActive&&self.beforeCursor(request,cursor()))items.push(request);else removed.push(request.id);});var result=self.patchList(list,items,removed);result.forEach(function(request){if(clients[request.client.id]){request.client=clients[request.client.id];}});list(result.sort(self.byPriority));}
+update(self.worker.requests,self.worker.requestsCursor,true);update(self.worker.completedRequests,self.worker.completedCursor,false);self.worker.clients(self.patchList(self.worker.clients,res.clients,[]));};self.byPriority=function(a,b){return a.client_priority-b.client_priority||a.id-b.id;};self.beforeCursor=function(request,cursor){if(!cursor)return true;var last=cursor.split('.');return self.byPriority(request,{client_priority:Number(last[0]),id:Number(last[1])})<=0;};self.applyShift=function(res){var priorities={};res.requests.forEach(function(pair){priorities[pair[0]]=pair[1];});[[self.worker.requests,self.worker.requestsCursor],[self.worker.completedRequests,self.worker.completedCursor]].forEach(function(pair){var result=pair[0]().map(function(request){if(priorities[request.id]===undefined)return request;return $.extend({},request,{client_priority:priorities[request.id]});}).filter(function(request){return self.beforeCursor(request,pair[1]());});pair[0](result.sort(self.byPriority));});};self.stream=null;self.reloadRequests=function(){self.loadPage('/requests',self.worker.requests,self.worker.requestsCursor,true);if(self.worker.completedRequests.loaded){self.updateCompletedRequests();}};self.openStream=function(){if(self.stream||!window.EventSource)return;var opened=false;self.stream=new EventSource(self.worker.location.uri('/requests/stream'));self.stream.onopen=function(){if(opened)self.reloadRequests();opened=true;};['create','update','complete','delete'].forEach(function(name){self.stream.addEventListener(name,function(e){self.applyRequestsDelta(JSON.parse(e.data));});});self.stream.addEventListener('shift',function(e){self.applyShift(JSON.parse(e.data));});self.stream.addEventListener('reset',self.reloadRequests);};self.closeStream=function(){if(self.stream){self.stream.close();self.stream=null;}};self.worker.login.subscribe(function(login){if(login)self.openStream();else self.closeStream();});self.getClients=function(){if(!self.worker.clients()||self.worker.clients().length===0){self.worker.location.get('/clients',function(res){self.worker.clients.loaded=true;self.worker.clients(res);},self.err);}};self.addClient=function(){if(self.worker.newClient().length>3){self.worker.location.post('/clients/new',{name:self.worker.newClient()},function(res){if(res.error!==undefined)self.worker.message({error:res.error});else{self.worker.clients(self.patchList(self.worker.clients,res.clients,res.removed));self.worker.newClient('');}},self.err,'&delta=1')}
+else self.worker.message({error:'Client name too short'});};self.updateClient=function(){if(self.worker.editClient().name<3){self.worker.message({error:'Client name too short'});}else{self.worker.location.post('/clients/edit',self.worker.editClient(),function(res){if(res.error!==undefined)self.worker.message({error:res.error});else self.worker.clients(self.patchList(self.worker.clients,res.clients,res.removed));},self.err,'&delta=1')}};self.removeClient=function(client){self.worker.location.post('/clients/delete',client,function(res){if(res.error!==undefined)self.worker.message({error:res.error});else self.worker.clients(self.patchList(self.worker.clients,res.clients,res.removed));},self.err,'&delta=1');};self.getAreas=function(){if(!self.worker.areas()||self.worker.areas().length===0){self.worker.location.get('/areas',function(res){self.worker.areas.loaded=true;self.worker.areas(res);},self.err);}};self.addProductArea=function(){if(self.worker.newProductArea().length>3){self.worker.location.post('/areas/new',{name:self.worker.newProductArea()},function(res){if(res.error!==undefined)self.worker.message({error:res.error});else{self.worker.areas(self.patchList(self.worker.areas,res.areas,res.removed));self.worker.newProductArea('');}},self.err,'&delta=1')}};self.updateProductArea=function(){if(self.worker.editProductArea().name<3){self.worker.message({error:'Product area too short'})}else{self.worker.location.post('/areas/edit',self.worker.editProductArea(),function(res){if(res.error===undefined){self.worker.areas(self.patchList(self.worker.areas,res.areas,res.removed));}else self.worker.message({error:res.error});},self.err,'&delta=1');}};self.removeProductArea=function(area){self.worker.location.post('/areas/delete',area,function(res){if(res.error!==undefined)self.worker.message({error:res.error});else self.worker.areas(self.patchList(self.worker.areas,res.areas,res.removed));},self.err,'&delta=1');};self.onProfilePath=function(){self.routeName(null);self.data({name:'profile'});self.actionName(null);self.checkAuth();self.getRequests();self.getCompletedRequests();self.getClients();self.getAreas();self.tooltip();};self.onAboutPath=function(){self.routeName(null);self.data({name:'about'});self.actionName(null);};self.onLicensePath=function(){self.routeName(null);self.data({name:'license'});self.actionName(null);};self.onRoute=function(){self.routeName(this.params.route);self.data({name:'profile'});self.actionName(null);self.checkAuth();self.tooltip();};self.onAction=function(){self.routeName(this.params.route);self.data({name:'profile'});self.actionName(this.params.action);self.checkAuth();self.tooltip();};self.router=new Sammy(function(){this.get('#profile',self.onProfilePath);this.get('#about',self.onAboutPath);this.get('#license',self.onLicensePath);this.get('#profile/:route',self.onRoute);this.get('#profile/:route/:action',self.onAction);this.get('',function(){this.app.runRoute('get','#about');});}).run();self.closeAlert=function(){self.worker.message({error:null,info:null});};self.err=self.worker.err;self.modalLogin=function(){$('#modalLogin').modal();};self.modalRegister=function(){self.worker.user({email:null,first_name:null,last_name:null});$('#modalRegister').modal();};self.modalNewClient=function(){$('#newClientModal').modal();};self.modalNewProductArea=function(){$('#modalNewProductArea').modal();};self.editClient=function(elem){self.worker.editClient(elem);$('#editClientModal').modal();};self.editProductArea=function(area){self.worker.editProductArea(area);$('#modalEditProductArea').modal();};self.markAsCompletedModal=function(request){self.worker.markRequest(request);$('#modalMarkAsComplete').modal();};self.removeRequestModal=function(request){self.worker.removeRequest(request);$('#modalRemoveRequest').modal();};self.removeRequest=function(){var data={id:self.worker.removeRequest()['id']};self.worker.location.post('/requests/delete',data,function(res){if(res.error===undefined){self.applyRequestsDelta(res);}else self.worker.message({error:res.error});},self.err,'&delta=1');};self.markRequest=function(){var data={id:self.worker.markRequest()['id']};self.worker.location.post('/requests/complete',data,function(res){if(res.error===undefined){self.applyRequestsDelta(res);}else self.worker.message({error:res.error});},self.err,'&delta=1')};self.goTo=function(route){location.hash='#profile/'+route;};self.openLink=function(path){return function(){self.tooltip();location.hash='#profile'+path;};};self.goToAction=function(path){return function(){location.hash='#profile/'+path;}};self.addRequest=function(){var request=self.worker.newRequest();if(request.title.length<3){self.worker.message({error:"Title too short"});}
+if(request.description.length<10){self.worker.message({error:"Description too short"});}
+var client=self.worker.chosenClient();if(client&&!client.client_priority){self.worker.message({error:"Client priority can't be empty"});}
+if(client&&Number(client.client_priority)<1){self.worker.message({error:"Client priority can't be 0"});}
+if(!request.target_date){self.worker.message({error:"Set up target date"})}
+if(self.worker.isDate(request.target_date)){var oldDate=request.target_date;var dateArray=oldDate.split("-");var newDate=dateArray[1]+'/'+dateArray[2]+'/'+dateArray[0];self.worker.newRequest({title:request.title,description:request.description,client:self.worker.chosenClient(),target_date:newDate,product_area:request.product_area});}else self.worker.message({error:"The date has the wrong format"});var msg=self.worker.message();if(msg===undefined||msg.error===undefined){self.worker.location.post('/requests/new',self.worker.newRequest(),function(res){if(res.error)self.worker.message({error:res.error});else{self.applyRequestsDelta(res);self.worker.initRequest();self.worker.chosenClient(null);location.hash='#profile/requests';}},self.err,'&delta=1');}};self.openRequest=function(request){self.worker.requestInfo(request);location.hash='#profile/requests/info';};self.editRequest=function(request){var date=self.worker.getDate(request.target_date);self.worker.editClient(request.client);self.worker.selectedProductArea(request.product_area);self.worker.editRequest({id:request.id,title:request.title,description:request.description,client:self.worker.editClient(),target_date:date,client_priority:request.client_priority,product_area:request.product_area});$('#edit_client').change(function(){var client=self.worker.editRequest().client;if(client!==undefined){self.worker.editClient(client);$('#edit_client_priority').val(client.client_priority);}});$('#edit_product_area').change(function(){var request=self.worker.editRequest();if(request!==undefined){self.worker.selectedProductArea(request.product_area);}});$('#edit_client_priority').change(function(){var client=self.worker.editClient();client.client_priority=self.worker.editRequest().client_priority;self.worker.editClient(client);});location.hash='#profile/requests/edit';};self.updateRequest=function(){var data;var date;var request=self.worker.editRequest();if(request.client!==undefined)self.worker.editClient(request.client);if(request.product_area!==undefined){self.worker.selectedProductArea(request.product_area);}
+if(self.worker.isDate(request.target_date)){var oldDate=request.target_date;var dateArray=oldDate.split("-");date=dateArray[1]+'/'+dateArray[2]+'/'+dateArray[0];}else self.worker.message({error:"The date has the wrong format"});if(request.title.length<3)self.worker.message({error:"Title is too short"});if(request.description.length<3)self.worker.message({error:"Description is too short"});if(request.target_date===undefined)self.worker.message({error:"Must have a date"});if(Number(self.worker.editClient().client_priority)<1)self.worker.message({error:"Must have a priority"});var msg=self.worker.message();if(msg===undefined||msg.error===undefined){data={id:request.id,title:request.title,description:request.description,client:self.worker.editClient(),target_date:date,product_area:self.worker.selectedProductArea()};request.client_priority=self.worker.editClient().client_priority;request.client=self.worker.editClient();request.product_area=self.worker.selectedProductArea();self.worker.editRequest(request);self.worker.location.post('/requests/edit',data,function(res){if(res.error){self.worker.message({error:res.error});}
+else{self.applyRequestsDelta(res);self.worker.message({info:"Request was updated"});location.hash='#profile/requests';}},self.err,'&delta=1')}};self.tooltip=function(){if('ontouchstart'in document.documentElement){return null;}else{$('.tltip').tooltip();}}};$(document).ready(function(){$(window).scroll(viewModel.onScroll);$('#body').removeClass('hide');if('ontouchstart'in document.documentElement){return null;}else{$('.tltip').tooltip();}});var viewModel=new ViewModel();ko.applyBindings(viewModel);}());
\ No newline at end of file
@@ -2,13 +2,30 @@
 # -*- coding: utf-8 -*-
 
 from unittest import TestCase, main
-from settings import HOST, CREDENTIALS
+from settings import HOST, CREDENTIALS, COMPRESS_MIN_SIZE, \
+    STATIC_COMPRESS_EXTENSIONS, STATIC_COMPRESS_LEVELS
 from requests import Session
 from re import search
-from json import dumps
+from threading import Thread
+from tempfile import mkstemp
+from os import remove
+from json import dumps, loads
 from datetime import datetime, date
-from resource import get_unique_str, is_index, convert_date, validator
+from resource import get_unique_str, is_index, convert_date, validator, \
+    make_cursor, parse_cursor, Cache, EventStream, WorkerPool, PoolBusy, \
+    choose_encoding, compress, compress_files, load_json_module, JSONEncoder
 from data_provider import *
+from models import engine, replicas, create_db_engine, Base, verified, \
+    needs_rehash, serializers, Serializer, User
+from secrets import keys
+from argon2 import PasswordHasher
+from configure import get_pool_status
+import data_provider
+from sqlalchemy import event, inspect
+from contextlib import contextmanager
+from werkzeug.http import parse_accept_header
+from zlib import decompress, MAX_WBITS
+from os import path
 
 req_session = Session()
 
@@ -159,29 +176,32 @@ class TestApp(TestCase):
         self.url = HOST + '%s?csrf=%s'
         self.headers = {'content-type': 'application/json'}
 
-    def post(self, url, data):
+    def post(self, url, data, query=''):
         """
-        Execute POST query with given URL and data, then
-        returns result
+        Execute POST query with given URL, data and query
+        string, then returns result
 
         :param url: string
         :param data: dictionary
+        :param query: string
         :return object:
         """
         return req_session.post(
-            self.url % (url, storage.get_csrf()),
+            self.url % (url, storage.get_csrf()) + query,
             cookies=storage.get_cookies(),
             data=dumps(data),
             headers=self.headers)
 
-    def get(self, url):
+    def get(self, url, query=''):
         """
-        Execute GET request with given URL, then return data
+        Execute GET request with given URL and query string,
+        then return data
 
         :param url: string
+        :param query: string
         :return object:
         """
-        return req_session.get(self.url % (url, storage.get_csrf()))
+        return req_session.get(self.url % (url, storage.get_csrf()) + query)
 
     def post_request(self, url, request, key, value):
         """
@@ -282,12 +302,11 @@ class TestApp(TestCase):
         self.assertEquals(r.status_code, 200)
         self.assertTrue('info' in r.json())
 
-        # check that user is logged out
+        # check that user is logged out, the token is revoked
         r = self.post('/logout', data={})
 
         # tests
-        self.assertEquals(r.status_code, 200)
-        self.assertTrue('info' in r.json())
+        self.assertEquals(r.status_code, 401)
 
     def test_04_get_auth_token(self):
         """
@@ -333,10 +352,19 @@ class TestApp(TestCase):
         self.assertEquals(user['last_name'], 'Doe')
         self.assertEquals(user['email'], 'john@doe.com')
 
+        # the old token is revoked with the password
+        old_token = storage.get_token()
+        r = self.post('/profile/update', {'user': usr, 'password': ''})
+        self.assertEquals(r.status_code, 401)
+        req_session.auth = (user['token'], '')
+
         # recovering user data
         data = {'user': CREDENTIALS, 'password': CREDENTIALS['password']}
         r = self.post('/profile/update', data=data)
         self.assertEquals(r.status_code, 200)
+        self.assertNotEquals(r.json()['token'], old_token)
+        storage.set_token(r.json()['token'])
+        req_session.auth = (storage.get_token(), '')
 
     def test_06_new_client(self):
         """
@@ -840,8 +868,7 @@ class TestApp(TestCase):
                 third_request = item
 
         # convert data
-        dt = datetime.strptime(first_request['target_date'],
-                               '%a, %d %b %Y %X GMT')
+        dt = datetime.strptime(first_request['target_date'], '%Y-%m-%d')
         if dt.month < 10:
             month = "0%s" % dt.month
         else:
@@ -930,6 +957,178 @@ class TestApp(TestCase):
 
         self.assertTrue(bool(_completed_request))
 
+    def test_16_conditional_get(self):
+        """
+        Tests for ETag of lists. Checks that a matching
+        If-None-Match header gets 304 without body, and that
+        the ETag is changed after the list is changed.
+
+        :return void:
+        """
+        url = self.url % ('/areas', storage.get_csrf())
+        r = req_session.get(url)
+        etag = r.headers['etag']
+        self.assertEquals(r.status_code, 200)
+
+        r = req_session.get(url, headers={'if-none-match': etag})
+        self.assertEquals(r.status_code, 304)
+        self.assertEquals(r.text, '')
+
+        r = req_session.get(url, headers={'if-none-match': '"other"'})
+        self.assertEquals(r.status_code, 200)
+
+        # test case changed list
+        r = self.post('/areas/new', {'name': 'etag product area'})
+        area = [item for item in r.json()
+                if item['name'] == 'etag product area'][0]
+        r = req_session.get(url, headers={'if-none-match': etag})
+        self.assertEquals(r.status_code, 200)
+        self.assertNotEquals(r.headers['etag'], etag)
+        self.post('/areas/delete', area)
+
+    def test_16_export_requests(self):
+        """
+        Tests for export of requests. Checks that all requests
+        are exported as NDJSON, filters are applied, CSV has
+        a header, and invalid filters return an error.
+
+        :return void:
+        """
+        active = self.get('/requests').json()
+        completed = self.get('/requests/get/completed').json()
+
+        # test case newline delimited JSON
+        r = self.get('/requests/export')
+        self.assertEquals(r.status_code, 200)
+        rows = [loads(line) for line in r.text.splitlines()]
+        self.assertEquals(sorted(item['id'] for item in rows),
+                          sorted(item['id'] for item in active + completed))
+
+        # test case filters
+        client = active[0]['client']['id']
+        r = self.get('/requests/export', '&status=active&client=%s' % client)
+        rows = [loads(line) for line in r.text.splitlines()]
+        self.assertEquals(
+            sorted(item['id'] for item in rows),
+            sorted(item['id'] for item in active
+                   if item['client']['id'] == client))
+        r = self.get('/requests/export', '&date_from=01/01/2100')
+        self.assertEquals(r.text, '')
+
+        # test case CSV
+        r = self.get('/requests/export', '&format=csv&status=active')
+        self.assertEquals(r.headers['content-type'], 'text/csv; charset=utf-8')
+        lines = r.text.splitlines()
+        self.assertTrue(lines[0].startswith('id,title,description,client'))
+        self.assertEquals(len(lines), len(active) + 1)
+
+        # test case invalid filters
+        for query in ('&client=a', '&date_to=2018', '&status=any'):
+            self.assertTrue('error' in self.get('/requests/export',
+                                                query).json())
+
+    def test_16_response_compression(self):
+        """
+        Tests for compression of responses. Checks that the list
+        of requests is compressed with gzip only if the client
+        accepts it, and that a compressed variant of a static
+        file is sent.
+
+        :return void:
+        """
+        url = self.url % ('/requests', storage.get_csrf())
+        r = req_session.get(url, headers={'accept-encoding': 'identity'})
+        self.assertTrue(len(r.content) >= COMPRESS_MIN_SIZE)
+        self.assertFalse('content-encoding' in r.headers)
+        self.assertTrue('Accept-Encoding' in r.headers['vary'])
+        requests = r.json()
+
+        r = req_session.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEquals(r.headers['content-encoding'], 'gzip')
+        self.assertEquals(r.json(), requests)
+        self.assertTrue(r.headers['etag'].startswith('W/'))
+
+        # test case compressed response is not modified
+        r = req_session.get(url, headers={'accept-encoding': 'gzip',
+                                          'if-none-match': r.headers['etag']})
+        self.assertEquals(r.status_code, 304)
+
+        # test case static file
+        folder = path.join(path.dirname(__file__), 'static', 'css')
+        files = compress_files(folder, STATIC_COMPRESS_EXTENSIONS,
+                               STATIC_COMPRESS_LEVELS)
+        try:
+            r = req_session.get(HOST + '/static/css/main.css',
+                                headers={'accept-encoding': 'gzip'})
+            self.assertEquals(r.status_code, 200)
+            self.assertEquals(r.headers['content-encoding'], 'gzip')
+            self.assertTrue(r.headers['content-type'].startswith('text/css'))
+            with open(path.join(folder, 'main.css'), 'rb') as css:
+                self.assertEquals(r.content, css.read())
+        finally:
+            for file_path in files:
+                remove(file_path)
+
+    def test_16_stream_requests(self):
+        """
+        Tests for the stream of changes of requests. Listens the
+        stream, creates a request and removes it, then checks
+        that create and delete events were received.
+
+        :return void:
+        """
+        def read_event(lines):
+            event = dict()
+            for line in lines:
+                if not line:
+                    # priorities could be shifted, if the client
+                    # priority is taken by a completed request
+                    if event.get('event') not in (None, 'shift'):
+                        return event
+                    event = dict()
+                    continue
+                key, _, value = line.partition(': ')
+                event[key] = value
+
+        active = self.get('/requests').json()
+        url = self.url % ('/requests/stream', storage.get_csrf())
+        stream = req_session.get(url, stream=True, timeout=10)
+        self.assertEquals(stream.headers['content-type'],
+                          'text/event-stream; charset=utf-8')
+        lines = stream.iter_lines(chunk_size=1)
+
+        request = {
+            'title': 'streamed request',
+            'description': 'description of streamed request',
+            'target_date': '06/14/2018',
+            'client': active[0]['client'],
+            'product_area': active[0]['product_area']
+        }
+        self.post('/requests/new', request)
+
+        event = read_event(lines)
+        self.assertEquals(event['event'], 'create')
+        created = loads(event['data'])['requests'][0]
+        self.assertEquals(created['title'], 'streamed request')
+
+        self.post('/requests/delete', created)
+        event = read_event(lines)
+        self.assertEquals(event['event'], 'delete')
+        self.assertEquals(loads(event['data'])['removed'], [created['id']])
+        stream.close()
+
+    def test_16_get_pool_info(self):
+        """
+        Tests for pool status path. Checks that status code is
+        200 and waiting time for a connection is returned.
+
+        :return void:
+        """
+        r = self.get('/status/pool')
+        self.assertEquals(r.status_code, 200)
+        self.assertTrue('wait_avg' in r.json())
+        self.assertTrue('wait_max' in r.json())
+
     def test_16_get_requests(self):
         """
         Tests for requests path. Sends GET request for
@@ -944,6 +1143,84 @@ class TestApp(TestCase):
         self.assertTrue(isinstance(r.json(), list))
         self.assertTrue(len(r.json()) > 1)
 
+        # read the same list page by page
+        requests = list()
+        query = '&limit=1'
+        while query:
+            page = self.get('/requests', query).json()
+            self.assertTrue(len(page['requests']) <= 1)
+            requests.extend(page['requests'])
+            query = '&limit=1&after=%s' % page['next'] if page['next'] else ''
+
+        self.assertEquals([item['id'] for item in requests],
+                          [item['id'] for item in r.json()])
+
+        # test case invalid limit and cursor
+        self.assertTrue('error' in self.get('/requests', '&limit=a').json())
+        r = self.get('/requests', '&limit=1&after=a')
+        self.assertTrue('error' in r.json())
+
+    def test_16_import_requests(self):
+        """
+        Tests for import of requests. Sends NDJSON and CSV
+        with valid and invalid rows, checks the summary of the
+        import and makes sure that imported requests are in the
+        list of requests. Then removes imported requests.
+
+        :return void:
+        """
+        client = storage.get_client()[0]
+        product_area = storage.get_product_area()
+        url = self.url % ('/requests/import', storage.get_csrf())
+
+        # test case newline delimited JSON
+        row = {
+            'title': 'imported request',
+            'description': 'description of imported request',
+            'target_date': '06/14/2018',
+            'client': {'id': client['id'], 'client_priority': 1},
+            'product_area': {'id': product_area['id']}
+        }
+        body = '\n'.join([dumps(row), dumps(row), 'not a json', '',
+                          dumps(dict(row, title='')),
+                          dumps(dict(row, target_date='13/45/2018'))])
+        r = req_session.post(url, data=body, cookies=storage.get_cookies(),
+                             headers={'content-type': 'application/x-ndjson'})
+        self.assertEquals(r.status_code, 200)
+        self.assertEquals(r.json()['created'], 2)
+        self.assertEquals(r.json()['skipped'], 3)
+        self.assertEquals([item['row'] for item in r.json()['errors']],
+                          [3, 4, 5])
+        self.assertEquals(r.json()['errors'][2]['error'],
+                          "The date has the wrong format")
+
+        # test case CSV
+        body = '\n'.join([
+            'title,description,target_date,client,client_priority,'
+            'product_area',
+            'imported csv,description of csv,06/14/2018,%s,2,%s' % (
+                client['id'], product_area['id']),
+            'imported csv,description of csv,06/14/2018,999999,2,%s' % (
+                product_area['id'])])
+        r = req_session.post(url, data=body, cookies=storage.get_cookies(),
+                             headers={'content-type': 'text/csv'})
+        self.assertEquals(r.status_code, 200)
+        self.assertEquals(r.json()['created'], 1)
+        self.assertEquals(r.json()['errors'][0]['error'],
+                          "The client is not found")
+
+        # imported requests have different client priorities
+        imported = [item for item in self.get('/requests').json()
+                    if item['title'].startswith('imported')]
+        self.assertEquals(len(imported), 3)
+        priorities = [item['client_priority'] for item in imported]
+        self.assertEquals(len(set(priorities)), 3)
+
+        # remove imported requests
+        for item in imported:
+            r = self.post('/requests/delete', {'id': item['id']})
+            self.assertFalse('error' in r.json())
+
     def test_17_remove_requests(self):
         """
         Tests for removal of request path. Sends post
@@ -980,6 +1257,16 @@ class TestApp(TestCase):
         r = self.post('/clients/delete', storage.get_client()[0])
         self.assertEquals(r.status_code, 200)
         self.assertTrue('error' in r.json())
+        self.assertFalse('blocking' in r.json())
+
+        # test case for amount of requests which block the removal
+        client_id = storage.get_client()[0]['id']
+        lists = self.get('/requests').json() + \
+            self.get('/requests/get/completed').json()
+        r = self.post('/clients/delete', storage.get_client()[0], '&count=1')
+        self.assertTrue('error' in r.json())
+        self.assertEquals(r.json()['blocking'], len(
+            [item for item in lists if item['client']['id'] == client_id]))
 
         # test case for removal of product area using id in request
         r = self.post('/areas/delete', storage.get_product_area())
@@ -1162,6 +1449,7 @@ class TestFunctions(TestCase):
         import datetime as date_type
         self.assertTrue(isinstance(convert_date('04/04/2000'), date_type.date))
         self.assertEquals(str(convert_date('04/04/2000')), '2000-04-04')
+        self.assertEquals(convert_date('13/45/2018'), None)
 
     def test_04_validator(self):
         """
@@ -1209,12 +1497,140 @@ class TestFunctions(TestCase):
         # test case valid tuple
         self.assertTrue(validator((1, 2, 3, 4), tuple, 3))
 
+    def test_05_cursor(self):
+        """
+        Test for make_cursor and parse_cursor functions.
+
+        :return void:
+        """
+        self.assertEquals(parse_cursor(make_cursor(2, 15)), (2, 15))
+        self.assertEquals(parse_cursor(u'3.4'), (3, 4))
+        self.assertFalse(parse_cursor('1'))
+        self.assertFalse(parse_cursor('a.b'))
+        self.assertFalse(parse_cursor('1.2.3'))
+        self.assertFalse(parse_cursor(None))
+
+    def test_06_cache(self):
+        """
+        Test for Cache class. Checks that the least recently
+        used item is dropped and that items expire after TTL.
+
+        :return void:
+        """
+        cache = Cache(2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        self.assertEquals(cache.get(1), 'a')
+        cache.set(3, 'c')
+        self.assertEquals(cache.get(2), None)
+        self.assertEquals(cache.get(1), 'a')
+        cache.delete(1)
+        self.assertEquals(cache.get(1, 'default'), 'default')
+
+        cache = Cache(2, ttl=-1)
+        cache.set(1, 'a')
+        self.assertEquals(cache.get(1), None)
+
+    def test_07_event_stream(self):
+        """
+        Test for EventStream class. Checks that events are sent
+        to every subscriber, and a subscriber with the full
+        queue is dropped.
+
+        :return void:
+        """
+        events = EventStream(1)
+        first = events.subscribe()
+        second = events.subscribe()
+        self.assertEquals(events.subscribers, 2)
+
+        events.publish('create', {'version': 1})
+        self.assertEquals(first.get_nowait(), ('create', {'version': 1}))
+        events.publish('delete', {'version': 2})
+        self.assertFalse(events.is_subscribed(second))
+        self.assertTrue(events.is_subscribed(first))
+
+        events.unsubscribe(first)
+        self.assertEquals(events.subscribers, 0)
+
+    def test_08_worker_pool(self):
+        """
+        Test for WorkerPool class. Checks that function runs in
+        the pool and in the calling thread without workers, and
+        that a full pool raises PoolBusy.
+
+        :return void:
+        """
+        self.assertTrue(WorkerPool(1, 1, 10).run(is_index, '5'))
+        self.assertFalse(WorkerPool(0, 1, 10).run(is_index, 'a'))
+        self.assertRaises(PoolBusy, WorkerPool(1, 0, 10).run, is_index, '5')
+
+    def test_09_compress(self):
+        """
+        Test for choose_encoding and compress functions. Checks
+        that the accepted encoding is chosen and gzip data is
+        decompressed to the same data.
+
+        :return void:
+        """
+        accept = parse_accept_header('gzip, deflate')
+        self.assertEquals(choose_encoding(accept, ['br', 'gzip']), 'gzip')
+        accept = parse_accept_header('gzip;q=0, identity')
+        self.assertEquals(choose_encoding(accept, ['br', 'gzip']), None)
+
+        data = dumps([{'client': {'id': 1, 'name': 'client'}}] * 100)
+        compressed = compress(data, 'gzip', 6)
+        self.assertTrue(len(compressed) < len(data))
+        self.assertEquals(decompress(compressed, 16 + MAX_WBITS), data)
+
+    def test_10_json_encoder(self):
+        """
+        Test for JSONEncoder class and load_json_module function.
+        Checks that dates are encoded in ISO format with the loaded
+        module, and that a missing module is skipped.
+
+        :return void:
+        """
+        module = load_json_module(['missing_json_module', 'json'])
+        self.assertEquals(module.__name__, 'json')
+        self.assertRaises(ImportError, load_json_module, ['missing_module'])
+
+        class Encoder(JSONEncoder):
+            pass
+
+        data = {'target_date': date(2018, 6, 14), 'ids': [1, 2]}
+        for encoder_module in (None, module):
+            Encoder.module = encoder_module
+            encoder = Encoder(separators=(',', ':'))
+            self.assertEquals(loads(encoder.encode(data)),
+                              {'target_date': '2018-06-14', 'ids': [1, 2]})
+            self.assertFalse(' ' in encoder.encode(data))
+
 
 class TestDatabaseFunctions(TestCase):
     """
     Tests for database functions from data_provider.py
     """
 
+    @contextmanager
+    def record_statements(self):
+        """
+        Record SQL statements executed by the engine inside
+        the with block
+
+        :return list: statements, filled while the block runs
+        """
+        statements = list()
+
+        def count_statement(*args):
+            statements.append(args[2])
+
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+
     def test_01_create_user(self):
         """
         Test for create_user function. Checks in returning
@@ -1238,6 +1654,24 @@ class TestDatabaseFunctions(TestCase):
         # save user
         storage.set_user(user)
 
+    def test_01_indexes(self):
+        """
+        Test that indexes of hot lookup columns are created,
+        and index of user email is unique.
+
+        :return void:
+        """
+        inspector = inspect(engine)
+        indexes = dict((index['name'], index)
+                       for index in inspector.get_indexes('request'))
+        self.assertTrue('ix_request_client_priority' in indexes)
+        self.assertTrue('ix_request_page' in indexes)
+        self.assertTrue('ix_request_product_area' in indexes)
+
+        indexes = dict((index['name'], index)
+                       for index in inspector.get_indexes('user'))
+        self.assertTrue(indexes['ix_user_email']['unique'])
+
     def test_02_get_user_by_id(self):
         """
         Test for get_user_by_id function. Checks returning data
@@ -1256,6 +1690,64 @@ class TestDatabaseFunctions(TestCase):
         self.assertEquals(user, storage.get_user())
         self.assertFalse(get_user_by_id(0))
 
+    def test_03_auth_tokens(self):
+        """
+        Test for auth tokens signed by the key ring. Checks that
+        the token is verified by the key id from the header, that
+        tokens of the old key are valid after rotation, and that
+        tokens with unknown key id are not valid.
+
+        :return void:
+        """
+        user = get_user_by_id(storage.get_user()['uid'])
+        token = user.generate_auth_token()
+        self.assertEquals(User.verify_auth_token(token), user.id)
+
+        # rotate key
+        key_id = keys.token_key_id
+        serializers['rotated'] = Serializer('Rotated_key_for_auth_tokens')
+        keys.token_key_id = 'rotated'
+        try:
+            new_token = user.generate_auth_token()
+            self.assertEquals(User.verify_auth_token(new_token), user.id)
+            self.assertEquals(User.verify_auth_token(token), user.id)
+        finally:
+            keys.token_key_id = key_id
+            del serializers['rotated']
+
+        self.assertEquals(User.verify_auth_token(new_token), None)
+        self.assertEquals(User.verify_auth_token('user@email.com'), None)
+        forged = Serializer('other').dumps({'uid': user.id},
+                                           header_fields={'kid': key_id})
+        self.assertEquals(User.verify_auth_token(forged), None)
+
+    def test_03_token_claims(self):
+        """
+        Test for claims of auth tokens. Checks that the token has
+        role, status and token version of the user, the version
+        is checked without a query, and revoke_tokens changes the
+        version, so the token is not valid anymore.
+
+        :return void:
+        """
+        user = get_user_by_id(storage.get_user()['uid'])
+        claims = User.load_auth_token(user.generate_auth_token())
+        self.assertEquals(claims['uid'], user.id)
+        self.assertEquals(claims['role'], user.role)
+        self.assertEquals(claims['status'], user.status)
+
+        get_token_version(user.id)
+        with self.record_statements() as statements:
+            self.assertEquals(get_token_version(user.id), claims['ver'])
+        self.assertEquals(len(statements), 0)
+
+        revoke_tokens(user.id)
+        self.assertEquals(get_token_version(user.id), claims['ver'] + 1)
+        claims = User.load_auth_token(
+            get_user_by_id(user.id).generate_auth_token())
+        self.assertEquals(claims['ver'], get_token_version(user.id))
+        self.assertEquals(get_token_version(0), None)
+
     def test_03_get_user_by_email(self):
         """
         Test for get_user_by_email function.
@@ -1269,6 +1761,25 @@ class TestDatabaseFunctions(TestCase):
         self.assertEquals(user, storage.get_user())
         self.assertFalse(get_user_by_id(0))
 
+    def test_04_rehash_password(self):
+        """
+        Test for rehash of passwords. Saves a hash made with other
+        Argon2 parameters, and checks that the hash is replaced
+        after successful login and the password is still valid.
+
+        :return void:
+        """
+        user = create_user('rehash@email.com', 'password', 'John', 'Doe')
+        user.hash = PasswordHasher(time_cost=1).hash('password')
+        session.commit()
+        self.assertTrue(needs_rehash(user.hash))
+
+        self.assertTrue(user.verify_password('password'))
+        rehash_password(user, 'password')
+        self.assertFalse(needs_rehash(user.hash))
+        self.assertTrue(get_user_by_id(user.id).verify_password('password'))
+        remove_user(user.id)
+
     def test_04_update_user(self):
         """
         Tests for updating user. Pass new user info to the
@@ -1287,8 +1798,12 @@ class TestDatabaseFunctions(TestCase):
         }
 
         # get result
+        version = get_token_version(user['uid'])
         new_user_info = update_user(user)
 
+        # tokens are revoked with the password
+        self.assertEquals(get_token_version(user['uid']), version + 1)
+
         # serialize result
         serialize_user = new_user_info.serialize
 
@@ -1301,6 +1816,55 @@ class TestDatabaseFunctions(TestCase):
         # save user
         storage.set_user(serialize_user)
 
+    def test_04_user_cache(self):
+        """
+        Test for cache of users. Checks that a cached user is
+        returned without queries, and that update of the user
+        invalidates the cache.
+
+        :return void:
+        """
+        uid = storage.get_user()['uid']
+        get_user_by_id(uid)
+        with self.record_statements() as statements:
+            user = get_user_by_id(uid)
+
+        self.assertEquals(len(statements), 0)
+        self.assertEquals(user.serialize, storage.get_user())
+
+        update_user({'uid': uid, 'password': None, 'email': None,
+                     'first_name': 'Jane', 'last_name': None})
+        self.assertEquals(get_user_by_id(uid).first_name, 'Jane')
+
+        storage.set_user(get_user_by_id(uid).serialize)
+
+    def test_04_verify_password_cache(self):
+        """
+        Test for cache of password verifications. Checks that a
+        successful verification is cached without the password
+        in the key, a wrong password is not cached, and the old
+        password is not valid after the password is changed.
+
+        :return void:
+        """
+        uid = storage.get_user()['uid']
+        user = get_user_by_id(uid)
+        verified.clear()
+
+        self.assertTrue(user.verify_password(u'new_password'))
+        self.assertTrue(user.verify_password('new_password'))
+        self.assertEquals(len(verified.items), 1)
+        self.assertFalse('new_password' in verified.items.keys()[0])
+
+        self.assertFalse(user.verify_password('wrong_password'))
+        self.assertEquals(len(verified.items), 1)
+
+        user = update_user({'uid': uid, 'password': 'other_password',
+                            'email': None, 'first_name': None,
+                            'last_name': None})
+        self.assertFalse(user.verify_password('new_password'))
+        self.assertTrue(user.verify_password('other_password'))
+
     def test_05_remove_user(self):
         """
         Test to make sure user was removed.
@@ -1432,6 +1996,30 @@ class TestDatabaseFunctions(TestCase):
         self.assertTrue(product_area_exist(storage.get_product_area()['id']))
         self.assertFalse(product_area_exist(0))
 
+    def test_12_reference_cache(self):
+        """
+        Test for cache of clients and product areas. Checks that
+        cached lookups do not query the database, and that update
+        and remove of a client invalidate the cache.
+
+        :return void:
+        """
+        client = create_client('cached client')
+        area_id = storage.get_product_area()['id']
+        self.assertTrue(client_exist(client.id))
+        self.assertTrue(product_area_exist(area_id))
+        with self.record_statements() as statements:
+            self.assertTrue(client_exist(client.id))
+            self.assertTrue(product_area_exist(area_id))
+        self.assertEquals(len(statements), 0)
+
+        update_client({'id': client.id, 'name': 'renamed client'})
+        self.assertEquals(get_client_info(client.id)['name'],
+                          'renamed client')
+
+        remove_client(client.id)
+        self.assertFalse(client_exist(client.id))
+
     def test_13_update_product_area(self):
         """
         Test for update_product_area function. Changes
@@ -1554,6 +2142,85 @@ class TestDatabaseFunctions(TestCase):
         self.assertTrue(isinstance(requests, list))
         self.assertTrue(len(requests) > 0)
 
+        # the list has the same shape as a serialized request
+        for item in requests:
+            self.assertEquals(item, get_requests_by_id(item['id']).serialize)
+
+        # names come from rows loaded with requests, not from the cache
+        client_id = requests[0]['client']['id']
+        data_provider.client_cache.set(
+            client_id, {'id': client_id, 'name': 'stale name'})
+        try:
+            self.assertEquals(get_requests(), requests)
+        finally:
+            data_provider.client_cache.delete(client_id)
+
+    def test_15_get_requests_queries(self):
+        """
+        Test that get_requests function does not run extra
+        queries for each request in the list.
+
+        :return void:
+        """
+        session.expire_all()
+        with self.record_statements() as statements:
+            requests = get_requests()
+
+        self.assertTrue(len(requests) > 1)
+        self.assertTrue(len(statements) <= 2)
+
+    def test_15_export_requests(self):
+        """
+        Test for export_requests function. Checks that exported
+        requests are the same as the list of requests when
+        they are read in small chunks.
+
+        :return void:
+        """
+        requests = get_requests()
+        with self.record_statements() as statements:
+            exported = list(export_requests(is_active=True, chunk_size=2))
+        self.assertEquals(sorted(exported, key=lambda item: item['id']),
+                          sorted(requests, key=lambda item: item['id']))
+
+        # client priorities are counted once, not for every chunk
+        self.assertTrue(len(exported) > 2)
+        counts = [item for item in statements if 'count(' in item]
+        self.assertEquals(len(counts), 1)
+
+        # client priorities counted from sparse rank keys
+        data_provider.SPARSE_RANKS = True
+        try:
+            requests = get_requests()
+            exported = list(export_requests(is_active=True, chunk_size=2))
+        finally:
+            data_provider.SPARSE_RANKS = False
+        self.assertEquals(sorted(exported, key=lambda item: item['id']),
+                          sorted(requests, key=lambda item: item['id']))
+
+        client_id = requests[0]['client']['id']
+        exported = list(export_requests(client_id=client_id, chunk_size=1))
+        self.assertTrue(len(exported) > 0)
+        for item in exported:
+            self.assertEquals(item['client']['id'], client_id)
+
+    def test_15_get_clients_queries(self):
+        """
+        Test that get_clients function counts client priority
+        of every client in one query, and client priorities are
+        the same as counted by the client.
+
+        :return void:
+        """
+        with self.record_statements() as statements:
+            clients = get_clients()
+
+        self.assertTrue(len(statements) <= 2)
+        for client in clients:
+            current = query(Client).filter_by(id=client['id']).first()
+            self.assertEquals(client['client_priority'],
+                              current.count_requests)
+
     def test_16_update_request(self):
         """
         Test for update_request function. Retrieves request
@@ -1620,6 +2287,34 @@ class TestDatabaseFunctions(TestCase):
         data['client_priority'] = 2
         self.assertFalse(client_priority_is_taken(data))
 
+    def test_17_check_request_data(self):
+        """
+        Test for check_request_data function. Checks that client,
+        product area, request and taken client priority are
+        checked with one query, and the results are the same as
+        from the separate checks.
+
+        :return void:
+        """
+        request = storage.get_request()[0]
+        data = {
+            'client': storage.get_client()[0]['id'],
+            'client_priority': 1,
+            'product_area': storage.get_product_area()['id']
+        }
+        with self.record_statements() as statements:
+            checks = check_request_data(data, request['id'])
+
+        self.assertEquals(len(statements), 1)
+        self.assertEquals(checks, {'client': True, 'product_area': True,
+                                   'request': True, 'taken': True})
+
+        data = {'client': 0, 'client_priority': 2, 'product_area': 0}
+        self.assertEquals(check_request_data(data, 0), {
+            'client': False, 'product_area': False, 'request': False,
+            'taken': False})
+        self.assertTrue(check_request_data(data)['request'])
+
     def test_18_update_client_priorities(self):
         """
         Test for update_client_priorities function. Checks
@@ -1638,11 +2333,25 @@ class TestDatabaseFunctions(TestCase):
         self.assertTrue(client_priority_is_taken(data))
 
         # update client priority
-        update_client_priorities(data)
+        with self.record_statements() as statements:
+            shifted = update_client_priorities(data)
 
         # make sure that client priority is free
         self.assertFalse(client_priority_is_taken(data))
 
+        # requests are shifted with one UPDATE statement
+        self.assertTrue(len(shifted) > 0)
+        updates = [item for item in statements
+                   if item.startswith('UPDATE request')]
+        self.assertEquals(len(updates), 1)
+        self.assertTrue(len(statements) <= 6)
+
+        # priorities of shifted requests exist
+        for request_id in shifted:
+            request = get_requests_by_id(request_id)
+            self.assertTrue(query(Priority).filter_by(
+                id=request.client_priority).first())
+
     def test_18_completed_request(self):
         """
         Test for completed_request function. Marks request
@@ -1701,6 +2410,56 @@ class TestDatabaseFunctions(TestCase):
 
         self.assertEquals(request['title'], storage.get_request()[1]['title'])
 
+    def test_21_request_events(self):
+        """
+        Test for events of changes of requests. Subscribes to the
+        events, creates a request with taken client priority and
+        removes both requests, then checks that shift, create and
+        delete events were published.
+
+        :return void:
+        """
+        client = create_client('events client')
+        data = {
+            'title': 'published request',
+            'description': 'description',
+            'client': client.id,
+            'client_priority': 1,
+            'target_date': date(year=2018, month=6, day=26),
+            'product_area': storage.get_product_area()['id']
+        }
+        create_request(data)
+        first = [item for item in get_requests()
+                 if item['client']['id'] == client.id][0]
+
+        queue = data_provider.request_events.subscribe()
+        try:
+            shifted = update_client_priorities(data)
+            create_request(data, shifted=shifted)
+
+            name, event = queue.get_nowait()
+            self.assertEquals(name, 'shift')
+            self.assertTrue([first['id'], first['client_priority'] + 1]
+                            in event['requests'])
+
+            name, event = queue.get_nowait()
+            self.assertEquals(name, 'create')
+            created = event['requests'][0]
+            self.assertEquals(created['title'], 'published request')
+            self.assertEquals(created['client_priority'],
+                              first['client_priority'])
+
+            remove_request(created['id'])
+            name, event = queue.get_nowait()
+            self.assertEquals(name, 'delete')
+            self.assertEquals(event['removed'], [created['id']])
+            self.assertTrue(queue.empty())
+        finally:
+            data_provider.request_events.unsubscribe(queue)
+
+        remove_request(first['id'])
+        remove_client(client.id)
+
     def test_22_remove_request(self):
         """
         Test for remove_request function. Removes requests
@@ -1712,6 +2471,179 @@ class TestDatabaseFunctions(TestCase):
             remove_request(int(request['id']))
             self.assertFalse(int(request_exist(request['id'])))
 
+    def test_22_requests_delta(self):
+        """
+        Test for delta responses of request functions. Creates
+        two requests with the same client priority and makes
+        sure that only the new and shifted requests are returned
+        and version of the requests list is increased.
+
+        :return void:
+        """
+        request = {
+            'title': 'delta request',
+            'description': 'description of delta request',
+            'client': storage.get_client()[0]['id'],
+            'client_priority': 1,
+            'target_date': date(2018, 6, 16),
+            'product_area': storage.get_product_area()['id']
+        }
+        first = create_request(request, delta=True)
+        self.assertEquals(len(first['requests']), 1)
+        self.assertEquals(first['removed'], [])
+        self.assertEquals(first['clients'][0]['id'], request['client'])
+        first_id = first['requests'][0]['id']
+
+        # create another request with the same client priority
+        shifted = update_client_priorities(request)
+        self.assertEquals(shifted, [first_id])
+        second = create_request(request, delta=True, shifted=shifted)
+        self.assertTrue(second['version'] > first['version'])
+        self.assertEquals(len(second['requests']), 2)
+        priorities = dict((item['id'], item['client_priority'])
+                          for item in second['requests'])
+        self.assertEquals(priorities[first_id], 2)
+        self.assertEquals(second['clients'][0]['client_priority'], 3)
+
+        # client priorities are counted once, for the changed client only
+        with self.record_statements() as statements:
+            get_requests_delta([first_id])
+        counts = [item for item in statements if 'count(' in item]
+        self.assertEquals(len(counts), 1)
+        self.assertTrue('request.client IN' in counts[0])
+
+        # remove requests
+        for request_id in priorities:
+            result = remove_request(request_id, delta=True)
+            self.assertEquals(result['requests'], [])
+            self.assertEquals(result['removed'], [request_id])
+        self.assertEquals(result['clients'][0]['client_priority'], 1)
+
+    def test_22_sparse_ranks(self):
+        """
+        Test for ordering by sparse rank keys. Inserts requests
+        on the top of client's list and makes sure that every
+        insert changes only the new row, and client priorities
+        are returned from 1 to N.
+
+        :return void:
+        """
+        data_provider.SPARSE_RANKS = True
+        renumber_ranks()
+        try:
+            request = {
+                'title': 'ranked request',
+                'description': 'description of ranked request',
+                'client': storage.get_client()[0]['id'],
+                'client_priority': 1,
+                'target_date': date(2018, 6, 16),
+                'product_area': storage.get_product_area()['id']
+            }
+
+            ids = list()
+            with self.record_statements() as statements:
+                for index in range(3):
+                    if client_priority_is_taken(request):
+                        update_client_priorities(request)
+                    result = create_request(request, delta=True)
+                    ids.insert(0, result['requests'][0]['id'])
+
+            # nothing but the version was updated
+            updates = [item for item in statements
+                       if item.startswith('UPDATE request')]
+            self.assertEquals(updates, [])
+
+            # client priorities are from 1 to N in the order of inserts
+            requests = [item for item in get_requests()
+                        if item['id'] in ids]
+            self.assertEquals([item['id'] for item in requests], ids)
+            self.assertEquals([item['client_priority'] for item in requests],
+                              [1, 2, 3])
+
+            # move the last request between the first and the second
+            request['id'] = ids[2]
+            request['client_priority'] = 2
+            result = update_request(request, delta=True)
+            priorities = dict((item['id'], item['client_priority'])
+                              for item in result['requests'])
+            self.assertEquals(priorities[ids[2]], 2)
+
+            # renumbering keeps the order
+            renumber_ranks(request['client'])
+            requests = [item['id'] for item in get_requests()
+                        if item['id'] in ids]
+            self.assertEquals(requests, [ids[0], ids[2], ids[1]])
+
+            # lists and pages are ordered by client priority
+            other = create_client('ranked client')
+            create_request(dict(request, client=other.id, client_priority=1))
+            request['client_priority'] = 1
+            update_client_priorities(request)
+            result = create_request(request, delta=True)
+            ids.append(result['requests'][0]['id'])
+            requests = get_requests()
+            priorities = [item['client_priority'] for item in requests]
+            self.assertEquals(priorities, sorted(priorities))
+            pages = list()
+            after = None
+            while True:
+                page = get_requests_page(True, 2, after)
+                pages.extend(page['requests'])
+                if not page['next']:
+                    break
+                after = parse_cursor(page['next'])
+            self.assertEquals(pages, requests)
+
+            for item in requests:
+                if item['client']['id'] == other.id:
+                    remove_request(item['id'])
+            remove_client(other.id)
+            for request_id in ids:
+                remove_request(request_id)
+        finally:
+            data_provider.SPARSE_RANKS = False
+
+    def test_22_relation_checks(self):
+        """
+        Test for check_client_relation, check_product_area_relation
+        and count functions. Checks that relations are found
+        without loading requests, and amounts are counted.
+
+        :return void:
+        """
+        client = create_client('relation client')
+        area = create_product_area('relation area')
+        self.assertFalse(check_client_relation(client.id))
+        self.assertFalse(check_product_area_relation(area.id))
+        self.assertEquals(count_client_relation(client.id), 0)
+
+        data = {
+            'title': 'relation request',
+            'description': 'description',
+            'client': client.id,
+            'client_priority': 1,
+            'target_date': date(year=2018, month=6, day=26),
+            'product_area': area.id
+        }
+        create_request(data)
+        data['client_priority'] = 2
+        create_request(data)
+
+        with self.record_statements() as statements:
+            self.assertTrue(check_client_relation(client.id))
+            self.assertTrue(check_product_area_relation(area.id))
+
+        self.assertEquals(len(statements), 2)
+        self.assertTrue(all('EXISTS' in item for item in statements))
+        self.assertEquals(count_client_relation(client.id), 2)
+        self.assertEquals(count_product_area_relation(area.id), 2)
+
+        for item in get_requests():
+            if item['client']['id'] == client.id:
+                remove_request(item['id'])
+        remove_client(client.id)
+        remove_product_area(area.id)
+
     def test_23_remove_client(self):
         """
         Test for 23_remove_client function. Removes clients
@@ -1752,6 +2684,96 @@ class TestDatabaseFunctions(TestCase):
         for item in product_areas_list:
             self.assertFalse(int(item['id']) == int(product_area['id']))
 
+    def test_25_connection_settings(self):
+        """
+        Test that SQLite connections use WAL journal mode,
+        and the pool reports waiting time for connections.
+
+        :return void:
+        """
+        if engine.dialect.name == 'sqlite':
+            mode = session.execute('PRAGMA journal_mode').scalar()
+            self.assertEquals(mode.lower(), 'wal')
+
+        status = get_pool_status(engine)
+        self.assertTrue(status['checkouts'] > 0)
+        self.assertTrue(status['wait_max'] >= status['wait_avg'] >= 0)
+
+        # every engine counts its own checkouts
+        checkouts = status['checkouts']
+        other_file = mkstemp(suffix='.db')[1]
+        other = create_db_engine('sqlite:///%s' % other_file)
+        try:
+            self.assertEquals(get_pool_status(other)['checkouts'], 0)
+            other.execute('SELECT 1')
+            self.assertEquals(get_pool_status(other)['checkouts'], 1)
+            self.assertEquals(get_pool_status(engine)['checkouts'],
+                              checkouts)
+        finally:
+            other.dispose()
+            remove(other_file)
+
+    def test_25_read_replica(self):
+        """
+        Test for read replicas. Adds an empty replica database,
+        makes sure that read-only functions use the replica, and
+        the session reads from the primary database after a write.
+
+        :return void:
+        """
+        replica_file = mkstemp(suffix='.db')[1]
+        replica = create_db_engine('sqlite:///%s' % replica_file)
+        Base.metadata.create_all(replica)
+        replicas.append(replica)
+        session.remove()
+
+        try:
+            # the replica database is empty
+            self.assertEquals(get_product_areas(), [])
+
+            # the session which just wrote reads from primary
+            area = create_product_area('replica product area')
+            areas = [item['id'] for item in get_product_areas()]
+            self.assertTrue(area.id in areas)
+            remove_product_area(area.id)
+        finally:
+            replicas.remove(replica)
+            session.remove()
+            replica.dispose()
+            remove(replica_file)
+
+    def test_25_place_requests(self):
+        """
+        Test for place_requests function. Places new requests
+        between existing requests and makes sure that requests
+        with taken client priority are shifted.
+
+        :return void:
+        """
+        existing = [(1, 10), (2, 11), (4, 12)]
+        new_requests = [(2, -1), (6, -2), (1, -3)]
+        self.assertEquals(place_requests(existing, new_requests), {
+            -3: 1, 10: 2, -1: 3, 11: 4, 12: 6, -2: 7})
+
+    def test_25_scoped_session(self):
+        """
+        Test that every thread uses its own database session,
+        and removed session is replaced by a new one.
+
+        :return void:
+        """
+        sessions = list()
+        thread = Thread(target=lambda: sessions.append(session()))
+        thread.start()
+        thread.join()
+
+        current = session()
+        self.assertFalse(sessions[0] is current)
+        self.assertTrue(session() is current)
+
+        session.remove()
+        self.assertFalse(session() is current)
+
 
 if __name__ == '__main__':
     main()
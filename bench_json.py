@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import date
+from json import dumps
+from timeit import repeat
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from app.resource import load_json_module, JSONEncoder
+from app.settings import JSON_ENCODERS
+
+ROWS = 10000
+REPEAT = 5
+MODULES = ['json', 'simplejson']
+
+
+def make_rows(amount):
+    """
+    Return list of requests like the list of /requests
+
+    :param amount: integer
+    :return list:
+    """
+    return [{
+        'id': index,
+        'title': 'Request title %s' % index,
+        'description': 'Description of the request %s' % index,
+        'client': {'id': index % 10, 'name': 'Client %s' % (index % 10)},
+        'client_priority': index,
+        'target_date': date(2018, 6, index % 28 + 1),
+        'product_area': {'id': index % 4, 'name': 'Area %s' % (index % 4)},
+        'is_active': True
+    } for index in xrange(amount)]
+
+
+def measure(encode):
+    """
+    Return the best time of REPEAT encodings in milliseconds
+
+    :param encode: function
+    :return float:
+    """
+    return min(repeat(encode, number=1, repeat=REPEAT)) * 1000
+
+
+if __name__ == '__main__':
+    rows = make_rows(ROWS)
+    print('Encoding of %s requests, best of %s:' % (ROWS, REPEAT))
+    print('%-40s %8.1f ms' % ('Flask default, sorted keys', measure(
+        lambda: dumps(rows, cls=FlaskJSONEncoder, sort_keys=True,
+                      separators=(',', ':')))))
+    print('%-40s %8.1f ms' % ('Flask default, debug indent', measure(
+        lambda: dumps(rows, cls=FlaskJSONEncoder, sort_keys=True,
+                      indent=2, separators=(', ', ': ')))))
+
+    for name in MODULES:
+        try:
+            JSONEncoder.module = load_json_module([name])
+        except ImportError:
+            print('%-40s not installed' % name)
+            continue
+
+        title = 'JSONEncoder with %s' % name
+        if name == load_json_module(JSON_ENCODERS).__name__:
+            title += ' (settings)'
+        print('%-40s %8.1f ms' % (title, measure(
+            lambda: dumps(rows, cls=JSONEncoder, separators=(',', ':')))))
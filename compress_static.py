@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app import app
+from app.resource import compress_files
+from app.settings import STATIC_COMPRESS_EXTENSIONS, STATIC_COMPRESS_LEVELS
+
+if __name__ == '__main__':
+    for file_path in compress_files(app.static_folder,
+                                    STATIC_COMPRESS_EXTENSIONS,
+                                    STATIC_COMPRESS_LEVELS):
+        print(file_path)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from gevent import monkey
+
+# sockets, threads and queues are patched before the app is imported
+monkey.patch_all()
+
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:
+    patch_psycopg = None
+else:
+    patch_psycopg()
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from app import *
+from app.settings import ASYNC_CONNECTIONS, POSTGRES
+
+if __name__ == '__main__':
+    if POSTGRES and patch_psycopg is None:
+        # every query would block all connections of the process
+        raise SystemExit('PostgreSQL needs psycogreen for the '
+                         'asynchronous server: pip install psycogreen')
+
+    app.debug = app_debug
+    server = WSGIServer((app_host, app_port), app,
+                        spawn=Pool(ASYNC_CONNECTIONS))
+    server.serve_forever()